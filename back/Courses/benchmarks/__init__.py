@@ -0,0 +1 @@
+# Archivo vacío para reconocer benchmarks como paquete
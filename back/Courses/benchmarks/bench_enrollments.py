@@ -0,0 +1,95 @@
+"""Benchmark de get_course_enrollments: join legado O(n·m) vs fallback indexado vs embedding
+
+Uso (desde back/Courses):
+    python -m benchmarks.bench_enrollments --latency 0.02 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://fake-postgrest")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "service")
+
+from benchmarks.fake_postgrest import FakePostgrest
+from controllers import course_controller
+from controllers.course_controller import CourseController
+from utils import supabase
+from utils.supabase_client import SupabaseClient
+
+SCHEMA = "tenant_bench"
+SIZES = [10, 1000, 10000]
+
+
+async def legacy_enrollees(client: SupabaseClient, schema: str, curso_id: int):
+    """Implementación original: dos requests y join con next() por inscripción"""
+    response = await client.get(f"{schema}_inscripciones", params={"curso_id": f"eq.{curso_id}", "select": "*"})
+    inscripciones = response.json()
+    ids_query = ",".join(str(i["usuario_id"]) for i in inscripciones)
+    usuarios = (await client.get(
+        f"{schema}_usuarios",
+        params={"id": f"in.({ids_query})", "select": "id,nombre,apellido,email,rol"}
+    )).json()
+    inscritos = []
+    for insc in inscripciones:
+        usuario = next((u for u in usuarios if u["id"] == insc["usuario_id"]), None)
+        if usuario:
+            inscritos.append(course_controller._format_inscrito(insc, usuario))
+    return inscritos
+
+
+def build_db(size: int, embedding: bool) -> FakePostgrest:
+    db = FakePostgrest(embedding=embedding)
+    db.seed_tenant(SCHEMA, "bench.edu", cursos=1, usuarios=size + 1, inscripciones_por_curso=size)
+    return db
+
+
+async def measure(mode: str, size: int, latency: float, runs: int):
+    db = build_db(size, embedding=(mode == "embedding"))
+    client = SupabaseClient("http://fake-postgrest", "anon", "service", transport=db.transport(latency))
+    supabase._supabase_client = client
+    course_controller._sin_embedding.clear()
+    await client.start()
+
+    timings = []
+    total = 0
+    for _ in range(runs):
+        db.calls.clear()
+        start = time.perf_counter()
+        if mode == "legacy":
+            inscritos = await legacy_enrollees(client, SCHEMA, 1)
+        else:
+            inscritos = await CourseController._fetch_course_enrollees(SCHEMA, 1)
+        timings.append((time.perf_counter() - start) * 1000)
+        total = len(inscritos)
+    await client.close()
+    return {
+        "median_ms": statistics.median(timings),
+        "upstream_calls": sum(db.calls.values()),
+        "rows": total,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.02, help="latencia simulada por request a Supabase (s)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES)
+    args = parser.parse_args()
+
+    print(f"latencia simulada: {args.latency * 1000:.0f} ms por request")
+    print(f"{'inscritos':>10} {'modo':>10} {'mediana ms':>12} {'requests':>9} {'filas':>7}")
+    for size in args.sizes:
+        for mode in ("legacy", "fallback", "embedding"):
+            try:
+                result = await measure(mode, size, args.latency, args.runs)
+            except Exception as e:
+                print(f"{size:>10} {mode:>10}   error: {e}")
+                continue
+            print(f"{size:>10} {mode:>10} {result['median_ms']:>12.1f} {result['upstream_calls']:>9} {result['rows']:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Benchmark de serialización del catálogo: costo de armar la respuesta a partir del cuerpo de PostgREST
+
+Compara, para catálogos de distintos tamaños:
+    legado       json.loads + jsonable_encoder + JSONResponse (lo que hacía FastAPI antes)
+    orjson       json.loads + FastJSONResponse (orjson)
+    validado     json.loads + TypeAdapter(List[CourseResponse]) + orjson (como "mis cursos")
+    passthrough  bytes de PostgREST insertados sin decodificar (catálogo sin paginar)
+
+Uso (desde back/Courses):
+    python -m benchmarks.bench_serialization --runs 5
+    python -m benchmarks.bench_serialization --sizes 1000 100000
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from models.course import CourseResponse
+from utils.serialization import ORJSON_DISPONIBLE, FastJSONResponse, splice
+
+SCHEMA = "tenant_bench"
+SIZES = [100, 1000, 10000, 50000]
+
+_adapter = TypeAdapter(List[CourseResponse])
+
+
+def upstream_body(size: int) -> bytes:
+    """Cuerpo como lo devuelve PostgREST para GET {schema}_cursos?select=*"""
+    cursos = [
+        {
+            "id": i,
+            "nombre": f"Curso {i:05d}",
+            "codigo": f"CUR-{i:05d}",
+            "descripcion": f"Descripción del curso {i}",
+            "creditos": 3 + i % 3,
+            "horario": "Lun-Mie 10:00-12:00",
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00",
+        }
+        for i in range(1, size + 1)
+    ]
+    return json.dumps(cursos).encode()
+
+
+def legado(raw: bytes) -> bytes:
+    return JSONResponse(jsonable_encoder({"tenant": SCHEMA, "cursos": json.loads(raw)})).body
+
+
+def con_orjson(raw: bytes) -> bytes:
+    return FastJSONResponse({"tenant": SCHEMA, "cursos": json.loads(raw)}).body
+
+
+def validado(raw: bytes) -> bytes:
+    cursos = _adapter.dump_python(_adapter.validate_python(json.loads(raw)))
+    return FastJSONResponse({"tenant": SCHEMA, "cursos": cursos}).body
+
+
+def passthrough(raw: bytes) -> bytes:
+    return splice({"tenant": SCHEMA}, cursos=raw)
+
+
+MODES: Dict[str, Callable[[bytes], bytes]] = {
+    "legado": legado,
+    "orjson": con_orjson,
+    "validado": validado,
+    "passthrough": passthrough,
+}
+
+
+def measure(fn: Callable[[bytes], bytes], raw: bytes, runs: int) -> float:
+    """Mediana en ms"""
+    fn(raw)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(raw)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES, help="cursos en el catálogo")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not ORJSON_DISPONIBLE:
+        print("⚠️ orjson no está instalado: FastJSONResponse usa json de la librería estándar")
+
+    print(f"{'cursos':>8} {'KB':>8} " + " ".join(f"{m + ' ms':>15}" for m in MODES) + f" {'vs legado':>10}")
+    for size in args.sizes:
+        raw = upstream_body(size)
+        # Todas las variantes deben producir el mismo JSON
+        reference = json.loads(legado(raw))
+        for name, fn in MODES.items():
+            assert json.loads(fn(raw)) == reference, name
+        results = {name: measure(fn, raw, args.runs) for name, fn in MODES.items()}
+        speedup = results["legado"] / results["passthrough"] if results["passthrough"] else float("inf")
+        print(f"{size:>8} {len(raw) / 1024:>8.0f} "
+              + " ".join(f"{results[m]:>15.2f}" for m in MODES)
+              + f" {speedup:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""PostgREST falso en memoria para benchmarks (sin Supabase real)"""
+import asyncio
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+_EMBED_RE = re.compile(r"^(?:(\w+):)?(\w+(?:!\w+)?)\((.*)\)$")
+
+
+def _split_top_level(value: str) -> List[str]:
+    """Separar por comas ignorando las que están dentro de paréntesis o comillas"""
+    parts, depth, current, quoted, escaped = [], 0, "", False, False
+    for ch in value:
+        if escaped:
+            escaped = False
+        elif ch == "\\" and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(raw: str) -> str:
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", raw[1:-1])
+    return raw
+
+
+def _like_regex(pattern: str) -> str:
+    """Traducir un patrón LIKE de PostgREST (* o % comodín, \\ escapa) a regex"""
+    out, escaped = "", False
+    for ch in pattern:
+        if escaped:
+            out += re.escape(ch)
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch in "*%":
+            out += ".*"
+        elif ch == "_":
+            out += "."
+        else:
+            out += re.escape(ch)
+    return out
+
+
+def _coerce(raw: str, sample: Any) -> Any:
+    if isinstance(sample, bool):
+        return raw == "true"
+    if isinstance(sample, int):
+        try:
+            return int(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+_IN_CACHE: Dict[str, frozenset] = {}
+
+
+def _in_values(raw: str) -> frozenset:
+    values = _IN_CACHE.get(raw)
+    if values is None:
+        values = _IN_CACHE[raw] = frozenset(v.strip('"') for v in raw.strip("()").split(","))
+        if len(_IN_CACHE) > 256:
+            _IN_CACHE.clear()
+    return values
+
+
+def _match_logic(row: Dict, op: str, expr: str) -> bool:
+    """Evaluar or=(...) / and=(...) con condiciones anidadas"""
+    results = []
+    for term in _split_top_level(expr.strip()[1:-1]):
+        term = term.strip()
+        nested = re.match(r"^(and|or)(\(.*\))$", term)
+        if nested:
+            results.append(_match_logic(row, nested.group(1), nested.group(2)))
+        else:
+            column, _, condition = term.partition(".")
+            results.append(_match(row, column, condition))
+    return any(results) if op == "or" else all(results)
+
+
+def _match(row: Dict, column: str, expr: str) -> bool:
+    op, _, raw = expr.partition(".")
+    raw = _unquote(raw) if op != "in" else raw
+    value = row.get(column)
+    if op == "in":
+        return str(value) in _in_values(raw)
+    if op == "is":
+        return value is None if raw == "null" else str(value).lower() == raw
+    target = _coerce(raw, value)
+    if op == "eq":
+        return value == target
+    if op == "neq":
+        return value != target
+    if value is None:
+        return False
+    if op in ("like", "ilike"):
+        pattern = _like_regex(raw)
+        flags = re.IGNORECASE if op == "ilike" else 0
+        return re.fullmatch(pattern, str(value), flags) is not None
+    if op == "gt":
+        return value > target
+    if op == "gte":
+        return value >= target
+    if op == "lt":
+        return value < target
+    if op == "lte":
+        return value <= target
+    raise ValueError(f"Operador no soportado: {op}")
+
+
+class FakePostgrest:
+    """Subconjunto de PostgREST: filtros, select con embedding, order, limit, insert y delete"""
+
+    def __init__(self, embedding: bool = True):
+        self.tables: Dict[str, List[Dict]] = {}
+        # tabla -> {columna_fk: tabla_destino}
+        self.foreign_keys: Dict[str, Dict[str, str]] = {}
+        # tabla -> lista de columnas con restricción UNIQUE
+        self.unique: Dict[str, List[Tuple[str, ...]]] = {}
+        self.embedding = embedding
+        self.calls: Counter = Counter()
+        self._next_id: Counter = Counter()
+        self._index: Dict[str, Dict[Any, Dict]] = {}
+
+    # ─── Datos ───────────────────────────────────────────────
+
+    def add_rows(self, table: str, rows: List[Dict]):
+        data = self.tables.setdefault(table, [])
+        for row in rows:
+            if "id" not in row:
+                self._next_id[table] += 1
+                row["id"] = self._next_id[table]
+            else:
+                self._next_id[table] = max(self._next_id[table], row["id"])
+            data.append(row)
+        self._index.pop(table, None)
+
+    def _by_id(self, table: str) -> Dict[Any, Dict]:
+        index = self._index.get(table)
+        if index is None:
+            index = self._index[table] = {r["id"]: r for r in self.tables.get(table, [])}
+        return index
+
+    def seed_tenant(
+        self,
+        schema: str,
+        domain: str,
+        cursos: int = 20,
+        usuarios: int = 100,
+        inscripciones_por_curso: int = 10,
+        admin_email: Optional[str] = None,
+    ):
+        """Crear un tenant con cursos, usuarios e inscripciones sintéticos"""
+        self.add_rows("tenants", [{"domain": domain, "schema_name": schema}])
+        self.add_rows(f"{schema}_cursos", [
+            {
+                "id": i,
+                "nombre": f"Curso {i:05d}",
+                "codigo": f"CUR-{i:05d}",
+                "descripcion": f"Descripción del curso {i}",
+                "creditos": 3 + i % 3,
+                "horario": "Lun-Mie 10:00-12:00",
+                "created_at": "2024-01-01T00:00:00",
+                "updated_at": "2024-01-01T00:00:00",
+            }
+            for i in range(1, cursos + 1)
+        ])
+        admin_email = admin_email or f"admin@{domain}"
+        self.add_rows(f"{schema}_usuarios", [
+            {
+                "id": i,
+                "nombre": f"Nombre{i}",
+                "apellido": f"Apellido{i}",
+                "email": admin_email if i == 1 else f"user{i}@{domain}",
+                "rol": "admin" if i == 1 else "estudiante",
+            }
+            for i in range(1, usuarios + 1)
+        ])
+        self.add_rows(f"{schema}_inscripciones", [
+            {
+                "curso_id": c,
+                "usuario_id": 2 + (c * 7 + k) % max(usuarios - 1, 1),
+                "created_at": "2024-02-01T00:00:00",
+            }
+            for c in range(1, cursos + 1)
+            for k in range(min(inscripciones_por_curso, usuarios - 1))
+        ])
+        self.foreign_keys[f"{schema}_inscripciones"] = {
+            "curso_id": f"{schema}_cursos",
+            "usuario_id": f"{schema}_usuarios",
+        }
+        self.unique[f"{schema}_inscripciones"] = [("curso_id", "usuario_id")]
+        self.unique[f"{schema}_cursos"] = [("codigo",)]
+
+    # ─── Consultas ───────────────────────────────────────────
+
+    def _relation(self, table: str, target: str) -> Optional[Tuple[str, str]]:
+        """Devuelve ("to_one", fk) o ("to_many", fk) si existe relación"""
+        for column, dest in self.foreign_keys.get(table, {}).items():
+            if dest == target:
+                return "to_one", column
+        for column, dest in self.foreign_keys.get(target, {}).items():
+            if dest == table:
+                return "to_many", column
+        return None
+
+    def _project(self, table: str, row: Dict, select: str) -> Dict:
+        out: Dict[str, Any] = {}
+        for item in _split_top_level(select or "*"):
+            item = item.strip()
+            embed = _EMBED_RE.match(item)
+            if embed:
+                alias, target, columns = embed.groups()
+                target = target.split("!")[0]
+                kind, fk = self._relation(table, target)
+                if kind == "to_one":
+                    related = self._by_id(target).get(row.get(fk))
+                    out[alias or target] = self._project(target, related, columns) if related else None
+                else:
+                    rows = self.tables.get(target, [])
+                    out[alias or target] = [self._project(target, r, columns) for r in rows if r.get(fk) == row["id"]]
+            elif item == "*":
+                out.update(row)
+            else:
+                out[item] = row.get(item)
+        return out
+
+    def _filter(self, rows: List[Dict], params: httpx.QueryParams) -> List[Dict]:
+        for column, expr in params.multi_items():
+            if column in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            if column in ("or", "and"):
+                rows = [r for r in rows if _match_logic(r, column, expr)]
+            else:
+                rows = [r for r in rows if _match(r, column, expr)]
+        return rows
+
+    def _embedded_targets(self, select: str) -> List[str]:
+        targets = []
+        for item in _split_top_level(select or ""):
+            embed = _EMBED_RE.match(item.strip())
+            if embed:
+                targets.append(embed.group(2).split("!")[0])
+        return targets
+
+    def handle(self, method: str, table: str, params: httpx.QueryParams, body: bytes, headers: httpx.Headers) -> Tuple[int, Any]:
+        self.calls[table] += 1
+        if table not in self.tables:
+            return 404, {"code": "42P01", "message": f'relation "{table}" does not exist'}
+        rows = self.tables[table]
+
+        if method == "GET":
+            select = params.get("select", "*")
+            for target in self._embedded_targets(select):
+                if not self.embedding or self._relation(table, target) is None:
+                    return 400, {"code": "PGRST200", "message": f"Could not find a relationship between '{table}' and '{target}'"}
+            result = self._filter(rows, params)
+            order = params.get("order")
+            if order:
+                for spec in reversed(order.split(",")):
+                    column, _, direction = spec.partition(".")
+                    result = sorted(result, key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+            offset = int(params.get("offset", 0))
+            limit = params.get("limit")
+            result = result[offset:offset + int(limit)] if limit is not None else result[offset:]
+            return 200, [self._project(table, r, select) for r in result]
+
+        if method == "POST":
+            payload = json.loads(body or b"[]")
+            payload = payload if isinstance(payload, list) else [payload]
+            ignore_duplicates = "resolution=ignore-duplicates" in headers.get("prefer", "")
+            # Restricciones: FK y UNIQUE (todo el lote falla, como una transacción)
+            for row in payload:
+                for column, dest in self.foreign_keys.get(table, {}).items():
+                    if row.get(column) is not None and row[column] not in self._by_id(dest):
+                        return 409, {"code": "23503", "message": f"insert or update on table \"{table}\" violates foreign key constraint ({column})"}
+            inserted, seen = [], {cols: {tuple(r.get(c) for c in cols) for r in rows} for cols in self.unique.get(table, [])}
+            for row in payload:
+                keys = {cols: tuple(row.get(c) for c in cols) for cols in seen}
+                if any(keys[cols] in seen[cols] for cols in seen):
+                    if ignore_duplicates:
+                        continue
+                    return 409, {"code": "23505", "message": "duplicate key value violates unique constraint"}
+                for cols, key in keys.items():
+                    seen[cols].add(key)
+                inserted.append(dict(row))
+            self.add_rows(table, inserted)
+            return 201, inserted
+
+        if method == "DELETE":
+            deleted = self._filter(rows, params)
+            deleted_ids = {id(r) for r in deleted}
+            self.tables[table] = [r for r in rows if id(r) not in deleted_ids]
+            self._index.pop(table, None)
+            return 200, deleted
+
+        return 405, {"message": "Método no soportado"}
+
+    def transport(self, latency: float = 0.0) -> "FakeTransport":
+        return FakeTransport(self, latency)
+
+
+class FakeTransport(httpx.AsyncBaseTransport):
+    """Transporte httpx que responde desde FakePostgrest con latencia simulada"""
+
+    def __init__(self, db: FakePostgrest, latency: float = 0.0):
+        self.db = db
+        self.latency = latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        table = request.url.path.rsplit("/", 1)[-1]
+        status, payload = self.db.handle(request.method, table, request.url.params, body, request.headers)
+        return httpx.Response(status, json=payload, request=request)
@@ -0,0 +1,151 @@
+"""Servidor Redis mínimo en memoria (protocolo RESP2) para probar el caché compartido sin Redis real
+
+Soporta lo que usa utils/cache_backend.py: GET, SET (PX), PTTL, DEL, SCAN (MATCH/COUNT),
+PUBLISH y SUBSCRIBE. Uso:
+    python -m benchmarks.fake_redis --port 6390
+"""
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    raise TypeError(type(value))
+
+
+class FakeRedis:
+    """Datos con expiración y canales pub/sub compartidos por todas las conexiones"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes], writer: asyncio.StreamWriter) -> bytes:
+        self.commands += 1
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command == b"GET":
+            return _encode(self._get(args[1]))
+        if command == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == b"PTTL":
+            if self._get(args[1]) is None:
+                return _encode(-2)
+            expires_at = self.data[args[1]][1]
+            return _encode(-1 if expires_at is None else max(int((expires_at - time.monotonic()) * 1000), 0))
+        if command == b"DEL":
+            removed = 0
+            for key in args[1:]:
+                if self._get(key) is not None:
+                    del self.data[key]
+                    removed += 1
+            return _encode(removed)
+        if command == b"SCAN":
+            options = [a.upper() for a in args]
+            pattern = args[options.index(b"MATCH") + 1].decode() if b"MATCH" in options else "*"
+            keys = [k for k in list(self.data) if self._get(k) is not None and fnmatch.fnmatchcase(k.decode(), pattern)]
+            return _encode([b"0", keys])
+        if command == b"PUBLISH":
+            subscribers = self.channels.get(args[1], set())
+            for subscriber in list(subscribers):
+                subscriber.write(_encode([b"message", args[1], args[2]]))
+            return _encode(len(subscribers))
+        if command == b"SUBSCRIBE":
+            out = b""
+            for i, channel in enumerate(args[1:], 1):
+                self.channels.setdefault(channel, set()).add(writer)
+                out += _encode([b"subscribe", channel, i])
+            return out
+        if command == b"UNSUBSCRIBE":
+            channels = args[1:] or [c for c, subs in self.channels.items() if writer in subs]
+            out = b""
+            for channel in channels:
+                self.channels.get(channel, set()).discard(writer)
+                out += _encode([b"unsubscribe", channel, 0])
+            return out or _encode([b"unsubscribe", None, 0])
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if args:
+                    writer.write(self.execute(args, writer))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Escuchar en host:port (0 = puerto libre); devuelve el puerto"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _main(host: str, port: int):
+    server = FakeRedis()
+    port = await server.start(host, port)
+    print(f"FakeRedis escuchando en redis://{host}:{port}/0")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(_main(args.host, args.port))
@@ -0,0 +1,291 @@
+"""Prueba de carga de los endpoints de cursos contra un PostgREST falso en memoria
+
+Levanta la app (ASGI en proceso o uvicorn en un puerto local), la conecta a FakePostgrest
+con latencia simulada y mide cada endpoint con concurrencia controlada: throughput,
+p50/p95/p99 y llamadas a Supabase por request.
+
+Uso (desde back/Courses):
+    python -m benchmarks.load_test --latency 0.02 --requests 500 --concurrency 50
+    python -m benchmarks.load_test --mode http --cursos 2000 --usuarios 5000 --check
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("SUPABASE_URL", "http://fake-postgrest")
+os.environ.setdefault("SUPABASE_ANON_KEY", "anon")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "service")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+os.environ.setdefault("PREWARM_TENANTS", "true")
+# Medir con la precarga terminada, como antes de que fuera en segundo plano
+os.environ.setdefault("PREWARM_BLOCKING", "true")
+
+import httpx
+import jwt
+
+from benchmarks.fake_postgrest import FakePostgrest
+from utils import supabase, supabase_client
+from utils.cache import CACHES
+from utils.supabase_client import SupabaseClient
+
+SCHEMA = "tenant_bench"
+DOMAIN = "ucb.edu.bo"
+
+# (método, path, headers, json) para la i-ésima request de un escenario
+Request = Tuple[str, str, Dict[str, str], Any]
+
+# Llamadas a Supabase máximas por request (promedio) que --check acepta por escenario
+UPSTREAM_BUDGET = {
+    "list_courses": 1.0,
+    "list_courses_page": 1.0,
+    "my_courses": 2.0,
+    "enrollments": 2.0,
+    "enrollments_page": 2.0,
+    "enrollments_hot": 2.0,
+    "export_courses": 2.0,
+    "enroll": 2.0,
+    "enroll_async": 1.0,
+}
+# Sin embedding los joins se hacen en Python con un request extra
+UPSTREAM_BUDGET_SIN_EMBEDDING = {
+    **UPSTREAM_BUDGET, "my_courses": 3.0, "enrollments": 3.0, "enrollments_page": 3.0, "enrollments_hot": 3.0
+}
+
+
+def token(email: str) -> str:
+    payload = {"email": email, "sub": email, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return "Bearer " + jwt.encode(payload, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+
+
+def _new_enrollments(db: FakePostgrest, cursos: int, usuarios: int):
+    """Pares (curso, usuario) que todavía no existen, para que cada POST inscriba de verdad"""
+    existing = {(r["curso_id"], r["usuario_id"]) for r in db.tables[f"{SCHEMA}_inscripciones"]}
+    for usuario_id in range(2, usuarios + 1):
+        for curso_id in range(1, cursos + 1):
+            if (curso_id, usuario_id) not in existing:
+                yield curso_id, usuario_id
+
+
+def build_scenarios(db: FakePostgrest, cursos: int, usuarios: int) -> Dict[str, Callable[[int], Request]]:
+    admin = {"Authorization": token(f"admin@{DOMAIN}")}
+    # Tokens de estudiantes reutilizados en rotación (caché por usuario realista)
+    students = [{"Authorization": token(f"user{i}@{DOMAIN}")} for i in range(2, min(usuarios, 200) + 1)]
+
+    def student(i: int) -> Dict[str, str]:
+        return students[i % len(students)] if students else admin
+
+    pending = _new_enrollments(db, cursos, usuarios)
+
+    def enroll(i: int) -> Request:
+        curso_id, usuario_id = next(pending)
+        return "POST", "/api/courses/enroll", admin, {"curso_id": curso_id, "usuario_id": usuario_id}
+
+    # 202 inmediato; la cola agrupa las inscripciones en inserts por lotes
+    admin_async = {**admin, "Prefer": "respond-async"}
+
+    def enroll_async(i: int) -> Request:
+        curso_id, usuario_id = next(pending)
+        return "POST", "/api/courses/enroll", admin_async, {"curso_id": curso_id, "usuario_id": usuario_id}
+
+    return {
+        "list_courses": lambda i: ("GET", "/api/courses/", student(i), None),
+        "list_courses_page": lambda i: ("GET", "/api/courses/?limit=50", student(i), None),
+        "my_courses": lambda i: ("GET", "/api/courses/my-courses", student(i), None),
+        "enrollments": lambda i: ("GET", f"/api/courses/{1 + i % cursos}/enrollments", admin, None),
+        "enrollments_page": lambda i: ("GET", f"/api/courses/{1 + i % cursos}/enrollments?limit=20", admin, None),
+        # Todos piden el mismo curso a la vez: las lecturas idénticas se comparten (single-flight)
+        "enrollments_hot": lambda i: ("GET", "/api/courses/1/enrollments", admin, None),
+        "export_courses": lambda i: ("GET", "/api/courses/export?format=ndjson", student(i), None),
+        "enroll": enroll,
+        "enroll_async": enroll_async,
+    }
+
+
+def build_db(cursos: int, usuarios: int, inscripciones: int, embedding: bool) -> FakePostgrest:
+    db = FakePostgrest(embedding=embedding)
+    db.seed_tenant(SCHEMA, DOMAIN, cursos=cursos, usuarios=usuarios, inscripciones_por_curso=inscripciones)
+    return db
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    db: FakePostgrest,
+    make_request: Callable[[int], Request],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    for i in range(warmup):
+        method, path, headers, body = make_request(requests + i)
+        await client.request(method, path, headers=headers, json=body)
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            method, path, headers, body = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, json=body)
+            await response.aread()
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    calls_before = sum(db.calls.values())
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, requests))])
+    elapsed = time.perf_counter() - start
+    upstream = sum(db.calls.values()) - calls_before
+
+    return {
+        "requests": requests,
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "upstream_per_request": round(upstream / requests, 3),
+        "statuses": statuses,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(args) -> Dict[str, Dict[str, Any]]:
+    db = build_db(args.cursos, args.usuarios, args.inscripciones, embedding=not args.no_embedding)
+    supabase._supabase_client = SupabaseClient(
+        os.environ["SUPABASE_URL"], "anon", "service", transport=db.transport(args.latency)
+    )
+    if args.snapshot:
+        # Antes de importar main: main y utils.snapshot leen SNAPSHOT_MODE al importarse
+        os.environ["SNAPSHOT_MODE"] = "true"
+    import main
+    if args.no_singleflight:
+        supabase_client.SINGLEFLIGHT_ENABLED = False
+    if args.no_cache:
+        # Solo desactiva las respuestas cacheadas; tenants/usuarios/JWT siguen en caché
+        for name in ("catalogo", "mis_cursos"):
+            CACHES[name].ttl = 0
+    scenarios = build_scenarios(db, args.cursos, args.usuarios)
+    selected = args.scenarios or list(scenarios)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    async def drive(client: httpx.AsyncClient):
+        for name in selected:
+            results[name] = await run_scenario(
+                client, db, scenarios[name], args.requests, args.concurrency, args.warmup
+            )
+            print_row(name, results[name])
+
+    print(f"modo={args.mode} latencia={args.latency * 1000:.0f}ms cursos={args.cursos} "
+          f"usuarios={args.usuarios} inscripciones/curso={args.inscripciones} "
+          f"requests={args.requests} concurrencia={args.concurrency}")
+    print_header()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.mode == "asgi":
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits) as client:
+                await drive(client)
+    else:
+        import uvicorn
+        port = _free_port()
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning",
+                                backlog=max(2048, args.concurrency), timeout_keep_alive=75)
+        server = uvicorn.Server(config)
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+                await drive(client)
+        finally:
+            server.should_exit = True
+            await serving
+    return results
+
+
+def print_header():
+    print(f"{'escenario':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'upstream/req':>13}  estados")
+
+
+def print_row(name: str, r: Dict[str, Any]):
+    statuses = ",".join(f"{code}:{count}" for code, count in sorted(r["statuses"].items()))
+    print(f"{name:<18} {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+          f"{r['upstream_per_request']:>13.3f}  {statuses}")
+
+
+def check(results: Dict[str, Dict[str, Any]], embedding: bool = True) -> List[str]:
+    """Regresiones: más llamadas a Supabase de lo presupuestado o respuestas 5xx"""
+    budgets = UPSTREAM_BUDGET if embedding else UPSTREAM_BUDGET_SIN_EMBEDDING
+    problems = []
+    for name, r in results.items():
+        budget = budgets.get(name)
+        if budget is not None and r["upstream_per_request"] > budget:
+            problems.append(f"{name}: {r['upstream_per_request']} llamadas/request (máximo {budget})")
+        errors = sum(count for code, count in r["statuses"].items() if code >= 500)
+        if errors:
+            problems.append(f"{name}: {errors} respuestas 5xx")
+    return problems
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["asgi", "http"], default="asgi",
+                        help="asgi: en proceso sin red | http: uvicorn en un puerto local")
+    parser.add_argument("--latency", type=float, default=0.02, help="latencia simulada por request a Supabase (s)")
+    parser.add_argument("--cursos", type=int, default=200)
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--inscripciones", type=int, default=30, help="inscripciones por curso")
+    parser.add_argument("--requests", type=int, default=300, help="requests por escenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=5, help="requests previas no medidas")
+    parser.add_argument("--scenarios", nargs="*", help="subconjunto de escenarios (por defecto todos)")
+    parser.add_argument("--no-cache", action="store_true", help="desactivar el caché de respuestas")
+    parser.add_argument("--snapshot", action="store_true", help="servir cursos desde el snapshot local")
+    parser.add_argument("--no-singleflight", action="store_true", help="no compartir GETs idénticos en curso")
+    parser.add_argument("--no-embedding", action="store_true", help="simular PostgREST sin relaciones declaradas")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    parser.add_argument("--check", action="store_true", help="salir con código 1 si se excede UPSTREAM_BUDGET")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, default=str)
+    if args.check:
+        problems = check(results, embedding=not args.no_embedding)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print("✅ Llamadas a Supabase dentro del presupuesto")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
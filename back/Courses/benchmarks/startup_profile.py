@@ -0,0 +1,152 @@
+"""Perfil de arranque en frío: tiempo de import por módulo y tiempo hasta la primera respuesta sana
+
+Mide, en procesos nuevos (sin nada en caché del intérprete salvo los .pyc):
+    import       python -X importtime -c "import main": total de main y los módulos más lentos
+    /health      segundos desde lanzar server.py hasta el primer 200 de /health
+    /ready       segundos hasta el primer 200 de /ready (precarga terminada o fallida)
+
+Supabase apunta a un puerto cerrado: la precarga falla rápido y no se mide la red.
+
+Uso (desde back/Courses):
+    python -m benchmarks.startup_profile --runs 5
+    python -m benchmarks.startup_profile --check --import-budget 1500 --healthy-budget 3
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Módulos propios del servicio (el resto son dependencias)
+FIRST_PARTY = ("main", "routes", "controllers", "models", "utils")
+
+# Presupuestos que --check acepta (mediana de --runs procesos)
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+HEALTHY_BUDGET_S = float(os.getenv("STARTUP_HEALTHY_BUDGET_S", "3"))
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _env(port: Optional[int] = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_ANON_KEY": env.get("SUPABASE_ANON_KEY", "anon"),
+        "SUPABASE_SERVICE_ROLE_KEY": env.get("SUPABASE_SERVICE_ROLE_KEY", "service"),
+        "PREWARM_TIMEOUT": "2",
+        "WEB_CONCURRENCY": "1",
+        "LOG_LEVEL": "warning",
+    })
+    if port is not None:
+        env.update({"HOST": "127.0.0.1", "PORT": str(port)})
+    return env
+
+
+def import_profile() -> List[Tuple[str, int, int, int]]:
+    """(módulo, self µs, acumulado µs, profundidad) de cada import de main"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=APP_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            rows.append((module, int(own), int(cumulative), len(indent) // 2))
+    return rows
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_healthy(timeout: float = 30) -> Tuple[float, float]:
+    """Segundos hasta el primer 200 de /health y de /ready en un server.py recién lanzado"""
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "server.py"], cwd=APP_DIR, env=_env(port),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    healthy = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while ready is None:
+                if time.perf_counter() - start > timeout or proc.poll() is not None:
+                    raise RuntimeError(f"server.py no respondió en {timeout}s (código {proc.poll()})")
+                try:
+                    if healthy is None and client.get("/health").status_code == 200:
+                        healthy = time.perf_counter() - start
+                    if healthy is not None and client.get("/ready").status_code == 200:
+                        ready = time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return healthy, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="procesos por medición (se reporta la mediana)")
+    parser.add_argument("--top", type=int, default=15, help="módulos más lentos a listar")
+    parser.add_argument("--check", action="store_true", help="código 1 si se supera algún presupuesto")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS, help="ms para importar main")
+    parser.add_argument("--healthy-budget", type=float, default=HEALTHY_BUDGET_S, help="s hasta el primer /health")
+    args = parser.parse_args()
+
+    # Primera corrida descartada: compila los .pyc
+    import_profile()
+    profiles = [import_profile() for _ in range(args.runs)]
+    totals = [next(cum for module, _, cum, _ in rows if module == "main") / 1000 for rows in profiles]
+    rows = profiles[totals.index(statistics.median_low(totals))]
+
+    print(f"📦 import main: {statistics.median(totals):.0f} ms (mediana de {args.runs})")
+    print(f"\n{'módulo propio':<40} {'self ms':>9} {'acum ms':>9}")
+    for module, own, cumulative, _ in rows:
+        if module.split(".")[0] in FIRST_PARTY:
+            print(f"{module:<40} {own / 1000:>9.1f} {cumulative / 1000:>9.1f}")
+    print(f"\n{'módulo (top por self)':<40} {'self ms':>9} {'acum ms':>9}")
+    for module, own, cumulative, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"{module:<40} {own / 1000:>9.1f} {cumulative / 1000:>9.1f}")
+    # Imports directos de main: qué arrastra cada uno (fastapi, routes, utils...)
+    direct = sorted((r for r in rows if r[3] == 1), key=lambda r: -r[2])[:args.top]
+    print(f"\n{'importado por main':<40} {'acum ms':>9}")
+    for module, _, cumulative, _ in direct:
+        print(f"{module:<40} {cumulative / 1000:>9.1f}")
+
+    timings = [time_to_healthy() for _ in range(args.runs)]
+    healthy = statistics.median(t[0] for t in timings)
+    ready = statistics.median(t[1] for t in timings)
+    print(f"\n🚀 server.py -> /health 200: {healthy:.2f} s, /ready 200: {ready:.2f} s (mediana de {args.runs})")
+
+    if args.check:
+        problems = []
+        if statistics.median(totals) > args.import_budget:
+            problems.append(f"import main {statistics.median(totals):.0f} ms > {args.import_budget:.0f} ms")
+        if healthy > args.healthy_budget:
+            problems.append(f"primer /health {healthy:.2f} s > {args.healthy_budget:.2f} s")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Arranque dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
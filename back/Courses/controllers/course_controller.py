@@ -1,283 +1,693 @@
+import asyncio
 import httpx
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from typing import Dict
-import sys
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 import os
 
-# Añadir path para imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pydantic import TypeAdapter
 
-
-from models.course import Course, CourseEnrollment
-from utils.supabase import (
-    SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY,
-    get_tenant_from_email, get_tenant_info, get_user_by_email
+from models.course import Course, CourseEnrollment, CourseResponse
+from utils.bulk import BULK_MAX_ROWS
+from utils.export import ExportError, export_response, iter_pages, prime
+from utils.pagination import decode_cursor, encode_cursor, like_prefix, parse_fields, quote
+from utils.resilience import UpstreamError, is_failure, raise_for_upstream
+from utils.response_cache import (
+    CachedJSON, cached_json, catalog_cache, invalidate_tenant_responses, my_courses_cache
 )
+from utils.serialization import splice
+from utils.snapshot import snapshot_store
+from utils.write_queue import write_queue
+from utils.context import RequestContext
+from utils.supabase import get_supabase_client
+
+# Máximo de ids por filtro in.(...) para no exceder el largo de URL
+IN_FILTER_CHUNK = 500
+
+# Filas por cada POST/DELETE masivo hacia Supabase
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "200"))
+# POST/DELETE simultáneos de una operación masiva; debe quedar por debajo de
+# TENANT_MAX_CONCURRENCY para no agotar el bulkhead del tenant (y bloquear sus lecturas)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+
+# Tablas sin relación declarada en PostgREST: usan el join en Python
+_sin_embedding = set()
+
+# Cursos armados a partir de inscripciones (embebidos o unidos en Python): se validan
+# antes de cachearlos; el catálogo pasa tal cual desde PostgREST
+_cursos_adapter = TypeAdapter(List[CourseResponse])
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# Campos proyectables de cursos e inscritos (fields=...)
+# Las columnas de cursos son las de CourseResponse, así ambos no se desincronizan
+CURSO_FIELDS = list(CourseResponse.model_fields)
+INSCRITO_FIELDS = ["inscripcion_id", "usuario_id", "nombre", "apellido", "email", "rol", "fecha_inscripcion"]
+_USUARIO_FIELDS = ["nombre", "apellido", "email", "rol"]
+
+def _usuario_columns(fields: Optional[List[str]] = None) -> str:
+    """Columnas de {schema}_usuarios necesarias para los campos pedidos"""
+    columns = [f for f in _USUARIO_FIELDS if fields is None or f in fields]
+    return ",".join(["id"] + columns)
+
+def _format_inscrito(insc: Dict, usuario: Dict, fields: Optional[List[str]] = None) -> Dict:
+    inscrito = {
+        "inscripcion_id": insc["id"],
+        "usuario_id": usuario["id"],
+        "nombre": usuario.get("nombre"),
+        "apellido": usuario.get("apellido"),
+        "email": usuario.get("email"),
+        "rol": usuario.get("rol"),
+        "fecha_inscripcion": insc.get("created_at")
+    }
+    if fields is None:
+        return inscrito
+    return {f: inscrito[f] for f in fields}
+
+def _embedding_no_disponible(response) -> bool:
+    """PostgREST responde 400 (PGRST200) si no encuentra la relación a embeber"""
+    return response.status_code == 400 and "PGRST2" in response.text
+
+# Columnas del export completo en CSV (una fila por curso/inscrito)
+FULL_EXPORT_FIELDS = ["curso_id", "codigo", "curso_nombre"] + INSCRITO_FIELDS
+
+async def _rows(pages: AsyncIterator[List[Dict]]) -> AsyncIterator[Dict]:
+    async for page in pages:
+        for row in page:
+            yield row
+
+async def _prime(rows: AsyncIterator, detail: str) -> AsyncIterator:
+    """Traer la primera página antes de responder; Supabase caído sale como 503, el resto como 500"""
+    try:
+        return await prime(rows)
+    except ExportError as e:
+        if is_failure(e.response.status_code):
+            raise UpstreamError(f"Supabase respondió {e.response.status_code} al exportar") from e
+        raise HTTPException(status_code=500, detail=detail)
+
+async def _merge_by_course(cursos: AsyncIterator[Dict], inscritos: AsyncIterator[Dict]) -> AsyncIterator[Tuple[Dict, List[Dict]]]:
+    """Unir dos streams ordenados por id de curso sin cargarlos completos"""
+    pendiente = await anext(inscritos, None)
+    async for curso in cursos:
+        grupo = []
+        while pendiente is not None and pendiente["curso_id"] < curso["id"]:
+            pendiente = await anext(inscritos, None)
+        while pendiente is not None and pendiente["curso_id"] == curso["id"]:
+            grupo.append(pendiente)
+            pendiente = await anext(inscritos, None)
+        yield curso, grupo
 
 class CourseController:
     
     @staticmethod
-    async def list_courses(email: str) -> Dict:
-        """Listar todos los cursos del tenant"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_ANON_KEY,
-                "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-            }
-            table_name = f"{schema}_cursos"
+    async def _fetch_user_courses(schema: str, user_id) -> List[Dict]:
+        """Cursos de un usuario en un solo request (inscripciones → cursos embebidos)"""
+        client = get_supabase_client()
+        inscripciones_table = f"{schema}_inscripciones"
+        cursos_table = f"{schema}_cursos"
+        
+        snapshot = snapshot_store.get(schema)
+        if snapshot is not None:
+            # Solo los ids desde Supabase; los cursos salen del snapshot local
             response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/{table_name}?select=*&order=nombre.asc",
-                headers=headers
+                inscripciones_table,
+                params={"usuario_id": f"eq.{user_id}", "select": "curso_id"}
+            )
+            raise_for_upstream(response, "obtener inscripciones")
+            if response.status_code != 200:
+                raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+            curso_ids = list(dict.fromkeys(insc["curso_id"] for insc in response.json()))
+            if all(curso_id in snapshot.by_id for curso_id in curso_ids):
+                return [snapshot.by_id[curso_id] for curso_id in curso_ids]
+            # Algún curso todavía no llegó al snapshot: seguir por el camino normal
+        
+        if inscripciones_table not in _sin_embedding:
+            response = await client.get(
+                inscripciones_table,
+                params={"usuario_id": f"eq.{user_id}", "select": f"curso:{cursos_table}(*)"}
             )
             if response.status_code == 200:
-                return {"tenant": schema, "cursos": response.json()}
-            else:
-                raise HTTPException(status_code=500, detail="Error al obtener cursos")
+                return [insc["curso"] for insc in response.json() if insc.get("curso")]
+            raise_for_upstream(response, "obtener inscripciones")
+            if not _embedding_no_disponible(response):
+                raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+            _sin_embedding.add(inscripciones_table)
+        
+        # Fallback: dos requests
+        response = await client.get(
+            inscripciones_table,
+            params={"usuario_id": f"eq.{user_id}", "select": "curso_id"}
+        )
+        raise_for_upstream(response, "obtener inscripciones")
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+        curso_ids = list(dict.fromkeys(insc["curso_id"] for insc in response.json()))
+        if not curso_ids:
+            return []
+        
+        responses = await asyncio.gather(*[
+            client.get(
+                cursos_table,
+                params={"id": f"in.({','.join(map(str, chunk))})", "select": "*"}
+            )
+            for chunk in _chunks(curso_ids, IN_FILTER_CHUNK)
+        ])
+        for r in responses:
+            raise_for_upstream(r, "obtener cursos")
+        if any(r.status_code != 200 for r in responses):
+            raise HTTPException(status_code=500, detail="Error al obtener cursos")
+        return [curso for r in responses for curso in r.json()]
     
     @staticmethod
-    async def create_course(course: Course, email: str) -> Dict:
+    async def _fetch_course_enrollees(
+        schema: str,
+        curso_id: int,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Inscritos de un curso con sus datos de usuario en un solo request"""
+        client = get_supabase_client()
+        inscripciones_table = f"{schema}_inscripciones"
+        usuarios_table = f"{schema}_usuarios"
+        usuario_columns = _usuario_columns(fields)
+        
+        params = {"curso_id": f"eq.{curso_id}", "order": "id.asc"}
+        if after_id is not None:
+            params["id"] = f"gt.{after_id}"
+        if limit is not None:
+            params["limit"] = str(limit)
+        
+        if inscripciones_table not in _sin_embedding:
+            response = await client.get(
+                inscripciones_table,
+                params={**params, "select": f"id,created_at,usuario:{usuarios_table}({usuario_columns})"}
+            )
+            if response.status_code == 200:
+                return [
+                    _format_inscrito(insc, insc["usuario"], fields)
+                    for insc in response.json() if insc.get("usuario")
+                ]
+            raise_for_upstream(response, "obtener inscripciones")
+            if not _embedding_no_disponible(response):
+                raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+            _sin_embedding.add(inscripciones_table)
+        
+        # Fallback: inscripciones + usuarios, unidos con un índice por id
+        response = await client.get(
+            inscripciones_table,
+            params={**params, "select": "id,usuario_id,created_at"}
+        )
+        raise_for_upstream(response, "obtener inscripciones")
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+        inscripciones = response.json()
+        usuarios = await CourseController._fetch_usuarios(schema, inscripciones, usuario_columns)
+        return [
+            _format_inscrito(insc, usuarios[insc["usuario_id"]], fields)
+            for insc in inscripciones if insc["usuario_id"] in usuarios
+        ]
+    
+    @staticmethod
+    async def _fetch_usuarios(schema: str, inscripciones: List[Dict], columns: str) -> Dict:
+        """Usuarios de un conjunto de inscripciones, indexados por id"""
+        usuario_ids = list(dict.fromkeys(insc["usuario_id"] for insc in inscripciones))
+        if not usuario_ids:
+            return {}
+        client = get_supabase_client()
+        responses = await asyncio.gather(*[
+            client.get(
+                f"{schema}_usuarios",
+                params={"id": f"in.({','.join(map(str, chunk))})", "select": columns}
+            )
+            for chunk in _chunks(usuario_ids, IN_FILTER_CHUNK)
+        ])
+        for r in responses:
+            raise_for_upstream(r, "obtener usuarios")
+        if any(r.status_code != 200 for r in responses):
+            raise HTTPException(status_code=500, detail="Error al obtener usuarios")
+        return {u["id"]: u for r in responses for u in r.json()}
+    
+    @staticmethod
+    async def _iter_enrollees(schema: str, filters: Dict[str, str]) -> AsyncIterator[Dict]:
+        """Inscritos (con curso_id) recorridos por páginas en orden (curso_id, id)"""
+        client = get_supabase_client()
+        inscripciones_table = f"{schema}_inscripciones"
+        usuario_columns = _usuario_columns()
+        
+        embedded = inscripciones_table not in _sin_embedding
+        select = (
+            f"id,curso_id,created_at,usuario:{schema}_usuarios({usuario_columns})"
+            if embedded else "id,curso_id,usuario_id,created_at"
+        )
+        pages = iter_pages(client, inscripciones_table, {**filters, "select": select}, keys=("curso_id", "id"))
+        try:
+            async for page in pages:
+                usuarios = None if embedded else await CourseController._fetch_usuarios(schema, page, usuario_columns)
+                for insc in page:
+                    usuario = insc.get("usuario") if embedded else usuarios.get(insc["usuario_id"])
+                    if usuario:
+                        yield {"curso_id": insc["curso_id"], **_format_inscrito(insc, usuario)}
+        except ExportError as e:
+            if not (embedded and _embedding_no_disponible(e.response)):
+                raise
+            _sin_embedding.add(inscripciones_table)
+            async for inscrito in CourseController._iter_enrollees(schema, filters):
+                yield inscrito
+    
+    @staticmethod
+    async def list_courses(
+        ctx: RequestContext,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[str] = None,
+        codigo: Optional[str] = None,
+        nombre: Optional[str] = None
+    ) -> CachedJSON:
+        """Listar los cursos del tenant (respuesta cacheada por tenant y parámetros)"""
+        key = (ctx.schema, limit, after, fields, codigo, nombre)
+        return await cached_json(
+            catalog_cache, key,
+            lambda: CourseController._query_courses(ctx.schema, limit, after, fields, codigo, nombre)
+        )
+    
+    @staticmethod
+    async def _query_courses(
+        schema: str,
+        limit: Optional[int],
+        after: Optional[str],
+        fields: Optional[str],
+        codigo: Optional[str],
+        nombre: Optional[str]
+    ) -> Union[Dict, CachedJSON]:
+        """Cursos del tenant (paginación por cursor, proyección y filtros por prefijo)
+
+        Sin paginación el cuerpo de PostgREST se inserta en la respuesta sin decodificarlo.
+        """
+        # La paginación ordena por (nombre, id), así que ambas columnas van siempre en el select
+        columns = parse_fields(fields, CURSO_FIELDS, required=["id", "nombre"] if limit else [])
+        after_key = decode_cursor(after, str, int) if after else None
+        
+        snapshot = snapshot_store.get(schema)
+        if snapshot is not None:
+            cursos, next_cursor = snapshot.query(limit, after_key, columns, codigo, nombre)
+            if not limit:
+                return {"tenant": schema, "cursos": cursos}
+            return {"tenant": schema, "cursos": cursos, "next_cursor": next_cursor}
+        
+        params = {
+            "select": ",".join(columns) if columns else "*",
+            "order": "nombre.asc,id.asc"
+        }
+        if codigo:
+            params["codigo"] = f"like.{like_prefix(codigo)}"
+        if nombre:
+            params["nombre"] = f"ilike.{like_prefix(nombre)}"
+        if after_key:
+            last_nombre, last_id = after_key
+            params["or"] = f"(nombre.gt.{quote(last_nombre)},and(nombre.eq.{quote(last_nombre)},id.gt.{last_id}))"
+        if limit:
+            # Una fila extra indica si existe una página siguiente
+            params["limit"] = str(limit + 1)
+        
+        table_name = f"{schema}_cursos"
+        response = await get_supabase_client().get(table_name, params=params)
+        raise_for_upstream(response, "obtener cursos")
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Error al obtener cursos")
+        
+        if not limit:
+            return CachedJSON(splice({"tenant": schema}, cursos=response.content))
+        
+        # Con paginación hay que quitar la fila extra y calcular el cursor
+        cursos = response.json()
+        next_cursor = None
+        if len(cursos) > limit:
+            cursos = cursos[:limit]
+            next_cursor = encode_cursor(cursos[-1]["nombre"], cursos[-1]["id"])
+        return {"tenant": schema, "cursos": cursos, "next_cursor": next_cursor}
+    
+    @staticmethod
+    async def create_course(course: Course, ctx: RequestContext) -> Dict:
         """Crear nuevo curso (solo directores/admin)"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        
-        user_data = await get_user_by_email(email, schema)
-        if not user_data or user_data.get("rol") not in ["director", "admin"]:
-            raise HTTPException(status_code=403, detail="No tienes permisos para crear cursos")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                "Content-Type": "application/json",
-                "Prefer": "return=representation"
-            }
-            table_name = f"{schema}_cursos"
-            payload = {
-                "nombre": course.nombre,
-                "codigo": course.codigo,
-                "descripcion": course.descripcion,
-                "creditos": course.creditos,
-                "horario": course.horario,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/{table_name}",
-                json=payload,
-                headers=headers
+        schema = ctx.schema
+        await ctx.require_role(detail="No tienes permisos para crear cursos")
+        
+        table_name = f"{schema}_cursos"
+        payload = {
+            "nombre": course.nombre,
+            "codigo": course.codigo,
+            "descripcion": course.descripcion,
+            "creditos": course.creditos,
+            "horario": course.horario,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        response = await get_supabase_client().post(
+            table_name,
+            json=payload,
+            service_role=True,
+            headers={"Prefer": "return=representation"}
+        )
+        if response.status_code in [200, 201]:
+            curso = response.json()
+            snapshot_store.apply(schema, curso if isinstance(curso, list) else [curso])
+            await invalidate_tenant_responses(schema)
+            return {"success": True, "curso": curso}
+        else:
+            raise_for_upstream(response, "crear curso")
+            # El cuerpo de PostgREST queda en el log, no en la respuesta al cliente
+            print(f"⚠️ Supabase respondió {response.status_code} al crear curso: {response.text}")
+            raise HTTPException(status_code=500, detail="Error al crear curso")
+    
+    @staticmethod
+    async def enroll_course(enrollment: CourseEnrollment, ctx: RequestContext, asincrono: bool = False) -> Dict:
+        """Inscribir estudiante/profesor en curso (o encolar la inscripción y devolver el trabajo)"""
+        schema = ctx.schema
+        await ctx.require_role(detail="No tienes permisos para inscribir")
+        if asincrono:
+            return await write_queue.submit(
+                "inscribir", schema, {"curso_id": enrollment.curso_id, "usuario_id": enrollment.usuario_id}
             )
-            if response.status_code in [200, 201]:
-                return {"success": True, "curso": response.json()}
-            else:
-                raise HTTPException(status_code=500, detail=f"Error al crear curso: {response.text}")
+        
+        table_name = f"{schema}_inscripciones"
+        payload = {
+            "curso_id": enrollment.curso_id,
+            "usuario_id": enrollment.usuario_id,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        response = await get_supabase_client().post(
+            table_name,
+            json=payload,
+            service_role=True,
+            headers={"Prefer": "return=representation"}
+        )
+        if response.status_code in [200, 201]:
+            await invalidate_tenant_responses(schema)
+            return {"success": True, "inscripcion": response.json()}
+        else:
+            raise_for_upstream(response, "inscribir")
+            print(f"⚠️ Supabase respondió {response.status_code} al inscribir: {response.text}")
+            raise HTTPException(status_code=500, detail="Error al inscribir")
     
     @staticmethod
-    async def enroll_course(enrollment: CourseEnrollment, email: str) -> Dict:
-        """Inscribir estudiante/profesor en curso"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        user_data = await get_user_by_email(email, schema)
-        if not user_data or user_data.get("rol") not in ["director", "admin"]:
-            raise HTTPException(status_code=403, detail="No tienes permisos para inscribir")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                "Content-Type": "application/json",
-                "Prefer": "return=representation"
-            }
-            table_name = f"{schema}_inscripciones"
-            payload = {
-                "curso_id": enrollment.curso_id,
-                "usuario_id": enrollment.usuario_id,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/{table_name}",
-                json=payload,
-                headers=headers
+    async def bulk_enroll(rows: List[Dict], ctx: RequestContext) -> Dict:
+        """Inscripción masiva: valida una vez, descarta duplicados e inserta por lotes"""
+        schema = ctx.schema
+        await ctx.require_role(detail="No tienes permisos para inscribir")
+        
+        client = get_supabase_client()
+        table_name = f"{schema}_inscripciones"
+        
+        # Duplicados dentro de la misma solicitud
+        pendientes: Dict[tuple, Dict] = {}
+        for row in rows:
+            if row.get("error"):
+                row["estado"] = "error"
+                continue
+            key = (row["curso_id"], row["usuario_id"])
+            if key in pendientes:
+                row["estado"] = "duplicado"
+            else:
+                pendientes[key] = row
+        
+        # Inscripciones que ya existen en Supabase
+        curso_ids = sorted({k[0] for k in pendientes})
+        usuario_ids = sorted({k[1] for k in pendientes})
+        existing = await asyncio.gather(*[
+            client.get(
+                table_name,
+                params={
+                    "curso_id": f"in.({','.join(map(str, cursos))})",
+                    "usuario_id": f"in.({','.join(map(str, usuarios))})",
+                    "select": "id,curso_id,usuario_id"
+                },
+                service_role=True
             )
+            for cursos in _chunks(curso_ids, IN_FILTER_CHUNK)
+            for usuarios in _chunks(usuario_ids, IN_FILTER_CHUNK)
+        ])
+        for r in existing:
+            raise_for_upstream(r, "consultar inscripciones existentes")
+        if any(r.status_code != 200 for r in existing):
+            raise HTTPException(status_code=500, detail="Error al consultar inscripciones existentes")
+        for response in existing:
+            for insc in response.json():
+                row = pendientes.pop((insc["curso_id"], insc["usuario_id"]), None)
+                if row:
+                    row.update({"estado": "existente", "inscripcion_id": insc["id"]})
+        
+        await CourseController._insert_enrollments(schema, list(pendientes.values()))
+        
+        resumen = {estado: sum(1 for r in rows if r["estado"] == estado)
+                   for estado in ("inscrito", "existente", "duplicado", "error")}
+        if resumen["inscrito"]:
+            await invalidate_tenant_responses(schema)
+        return {"success": resumen["error"] == 0, "total": len(rows), **resumen, "resultados": rows}
+    
+    @staticmethod
+    async def _insert_enrollments(schema: str, rows: List[Dict], raise_upstream: bool = False) -> None:
+        """Insertar filas {curso_id, usuario_id} por lotes, dejando en cada una su estado
+        (inscrito, existente o error); si un lote falla con 4xx se divide en mitades hasta aislar
+        las filas con error. A lo sumo BULK_CONCURRENCY POST a la vez.
+        Con raise_upstream un 5xx de Supabase lanza UpstreamError en vez de marcar las filas."""
+        client = get_supabase_client()
+        table_name = f"{schema}_inscripciones"
+        created_at = datetime.utcnow().isoformat()
+        limit = asyncio.Semaphore(BULK_CONCURRENCY)
+        
+        async def insert(batch: List[Dict]) -> None:
+            payload = [
+                {"curso_id": r["curso_id"], "usuario_id": r["usuario_id"], "created_at": created_at}
+                for r in batch
+            ]
+            try:
+                async with limit:
+                    response = await client.post(
+                        table_name,
+                        params={"on_conflict": "curso_id,usuario_id"},
+                        json=payload,
+                        service_role=True,
+                        headers={"Prefer": "resolution=ignore-duplicates,return=representation"}
+                    )
+            except UpstreamError:
+                # Circuito abierto o bulkhead lleno: el lote queda con error, el resto sigue
+                if raise_upstream:
+                    raise
+                for r in batch:
+                    r.update({"estado": "error", "error": "Supabase no disponible"})
+                return
             if response.status_code in [200, 201]:
-                return {"success": True, "inscripcion": response.json()}
+                inserted = {(i["curso_id"], i["usuario_id"]): i for i in response.json()}
+                for r in batch:
+                    insc = inserted.get((r["curso_id"], r["usuario_id"]))
+                    if insc:
+                        r.update({"estado": "inscrito", "inscripcion_id": insc.get("id")})
+                    else:
+                        # Insertada por otra solicitud entre la consulta y el insert
+                        r["estado"] = "existente"
+            elif len(batch) > 1 and 400 <= response.status_code < 500:
+                # Bisección: una FK inválida en 200 filas cuesta ~2·log2(200) POST, no 200
+                half = len(batch) // 2
+                await asyncio.gather(insert(batch[:half]), insert(batch[half:]))
             else:
-                raise HTTPException(status_code=500, detail=f"Error al inscribir: {response.text}")
+                if raise_upstream:
+                    raise_for_upstream(response, "inscribir")
+                error = "Supabase no disponible" if is_failure(response.status_code) else response.text
+                for r in batch:
+                    r.update({"estado": "error", "error": error})
+        
+        await asyncio.gather(*[insert(batch) for batch in _chunks(rows, BULK_CHUNK_SIZE)])
     
     @staticmethod
-    async def get_my_courses(email: str) -> Dict:
-        """Obtener cursos del usuario actual"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        user_data = await get_user_by_email(email, schema)
-        if not user_data:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        
-        user_id = user_data["id"]
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_ANON_KEY,
-                "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-            }
-            
-            inscripciones_table = f"{schema}_inscripciones"
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/{inscripciones_table}?usuario_id=eq.{user_id}&select=*",
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                inscripciones = response.json()
-                curso_ids = [insc["curso_id"] for insc in inscripciones]
-                
-                if not curso_ids:
-                    return {"usuario": email, "rol": user_data.get("rol"), "cursos": []}
-                
-                cursos_table = f"{schema}_cursos"
-                ids_query = ",".join(map(str, curso_ids))
-                
-                cursos_response = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/{cursos_table}?id=in.({ids_query})&select=*",
-                    headers=headers
-                )
-                
-                if cursos_response.status_code == 200:
-                    cursos = cursos_response.json()
-                    return {"usuario": email, "rol": user_data.get("rol"), "cursos": cursos}
-                else:
-                    raise HTTPException(status_code=500, detail="Error al obtener cursos")
-            else:
-                raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+    async def get_my_courses(ctx: RequestContext) -> CachedJSON:
+        """Obtener cursos del usuario actual (respuesta cacheada por usuario)"""
+        async def load() -> Dict:
+            user_data = await ctx.require_user()
+            cursos = await CourseController._fetch_user_courses(ctx.schema, user_data["id"])
+            cursos = _cursos_adapter.dump_python(_cursos_adapter.validate_python(cursos))
+            return {"usuario": ctx.email, "rol": user_data.get("rol"), "cursos": cursos}
+        return await cached_json(my_courses_cache, (ctx.schema, ctx.email), load)
     
     @staticmethod
-    async def get_course_enrollments(curso_id: int, email: str) -> Dict:
+    async def get_course_enrollments(
+        curso_id: int,
+        ctx: RequestContext,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[str] = None
+    ) -> Dict:
         """Obtener estudiantes inscritos en un curso (solo directores/admin)"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        
-        # Verificar permisos
-        user_data = await get_user_by_email(email, schema)
-        if not user_data or user_data.get("rol") not in ["director", "admin"]:
-            raise HTTPException(status_code=403, detail="No tienes permisos")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_ANON_KEY,
-                "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-            }
-            
-            # Obtener inscripciones del curso
-            inscripciones_table = f"{schema}_inscripciones"
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/{inscripciones_table}?curso_id=eq.{curso_id}&select=*",
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                inscripciones = response.json()
-                usuario_ids = [insc["usuario_id"] for insc in inscripciones]
-                
-                if not usuario_ids:
-                    return {"curso_id": curso_id, "inscritos": []}
-                
-                # Obtener datos de usuarios
-                usuarios_table = f"{schema}_usuarios"
-                ids_query = ",".join(map(str, usuario_ids))
-                
-                usuarios_response = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/{usuarios_table}?id=in.({ids_query})&select=id,nombre,apellido,email,rol",
-                    headers=headers
-                )
-                
-                if usuarios_response.status_code == 200:
-                    usuarios = usuarios_response.json()
-                    # Combinar inscripciones con datos de usuario
-                    inscritos = []
-                    for insc in inscripciones:
-                        usuario = next((u for u in usuarios if u["id"] == insc["usuario_id"]), None)
-                        if usuario:
-                            inscritos.append({
-                                "inscripcion_id": insc["id"],
-                                "usuario_id": usuario["id"],
-                                "nombre": usuario["nombre"],
-                                "apellido": usuario["apellido"],
-                                "email": usuario["email"],
-                                "rol": usuario["rol"],
-                                "fecha_inscripcion": insc.get("created_at")
-                            })
-                    return {"curso_id": curso_id, "total": len(inscritos), "inscritos": inscritos}
-                else:
-                    raise HTTPException(status_code=500, detail="Error al obtener usuarios")
-            else:
-                raise HTTPException(status_code=500, detail="Error al obtener inscripciones")
+        selected = parse_fields(fields, INSCRITO_FIELDS, required=["inscripcion_id"] if limit else [])
+        after_id = decode_cursor(after, int)[0] if after else None
+        # La lectura corre en paralelo con la verificación de permisos
+        inscritos = await ctx.authorized(CourseController._fetch_course_enrollees(
+            ctx.schema, curso_id,
+            limit=limit + 1 if limit else None,
+            after_id=after_id,
+            fields=selected
+        ))
+        
+        result = {"curso_id": curso_id, "total": len(inscritos), "inscritos": inscritos}
+        if limit:
+            next_cursor = None
+            if len(inscritos) > limit:
+                inscritos = inscritos[:limit]
+                next_cursor = encode_cursor(inscritos[-1]["inscripcion_id"])
+            result.update({"total": len(inscritos), "inscritos": inscritos, "next_cursor": next_cursor})
+        elif not inscritos:
+            return {"curso_id": curso_id, "inscritos": []}
+        return result
     
     @staticmethod
-    async def delete_enrollment(inscripcion_id: int, email: str) -> Dict:
-        """Eliminar inscripción (solo directores/admin)"""
-        tenant_domain = get_tenant_from_email(email)
-        if not tenant_domain:
-            raise HTTPException(status_code=400, detail="Tenant no identificado")
-        
-        tenant_info = await get_tenant_info(tenant_domain)
-        if not tenant_info:
-            raise HTTPException(status_code=404, detail="Tenant no encontrado")
-        
-        schema = tenant_info["schema_name"]
-        
-        # Verificar permisos
-        user_data = await get_user_by_email(email, schema)
-        if not user_data or user_data.get("rol") not in ["director", "admin"]:
-            raise HTTPException(status_code=403, detail="No tienes permisos para eliminar inscripciones")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}"
-            }
-            table_name = f"{schema}_inscripciones"
-            response = await client.delete(
-                f"{SUPABASE_URL}/rest/v1/{table_name}?id=eq.{inscripcion_id}",
-                headers=headers
-            )
+    async def delete_enrollment(inscripcion_id: int, ctx: RequestContext, asincrono: bool = False) -> Dict:
+        """Eliminar inscripción (solo directores/admin), o encolar la eliminación"""
+        schema = ctx.schema
+        await ctx.require_role(detail="No tienes permisos para eliminar inscripciones")
+        if asincrono:
+            return await write_queue.submit("eliminar", schema, {"inscripcion_id": inscripcion_id})
+        
+        table_name = f"{schema}_inscripciones"
+        response = await get_supabase_client().delete(
+            table_name,
+            params={"id": f"eq.{inscripcion_id}"},
+            service_role=True
+        )
+        if response.status_code in [200, 204]:
+            await invalidate_tenant_responses(schema)
+            return {"success": True, "message": "Inscripción eliminada"}
+        else:
+            raise_for_upstream(response, "eliminar inscripción")
+            print(f"⚠️ Supabase respondió {response.status_code} al eliminar inscripción: {response.text}")
+            raise HTTPException(status_code=500, detail="Error al eliminar inscripción")
+    
+    @staticmethod
+    async def bulk_delete_enrollments(ids: List[int], ctx: RequestContext) -> Dict:
+        """Eliminar varias inscripciones por lotes (solo directores/admin)"""
+        schema = ctx.schema
+        await ctx.require_role(detail="No tienes permisos para eliminar inscripciones")
+        
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise HTTPException(status_code=400, detail="No se recibieron inscripciones")
+        if len(ids) > BULK_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ROWS} filas por solicitud")
+        
+        resultados = await CourseController._delete_enrollments(schema, ids)
+        
+        resumen = {estado: sum(1 for r in resultados if r["estado"] == estado)
+                   for estado in ("eliminada", "no_encontrada", "error")}
+        if resumen["eliminada"]:
+            await invalidate_tenant_responses(schema)
+        return {"success": resumen["error"] == 0, "total": len(resultados), **resumen, "resultados": resultados}
+    
+    @staticmethod
+    async def _delete_enrollments(schema: str, ids: List[int], raise_upstream: bool = False) -> List[Dict]:
+        """Eliminar inscripciones por lotes; un resultado por id (eliminada, no_encontrada o error)"""
+        client = get_supabase_client()
+        table_name = f"{schema}_inscripciones"
+        batches = _chunks(ids, BULK_CHUNK_SIZE)
+        limit = asyncio.Semaphore(BULK_CONCURRENCY)
+        
+        async def delete(batch: List[int]) -> Optional[httpx.Response]:
+            try:
+                async with limit:
+                    return await client.delete(
+                        table_name,
+                        params={"id": f"in.({','.join(map(str, batch))})"},
+                        service_role=True,
+                        headers={"Prefer": "return=representation"}
+                    )
+            except UpstreamError:
+                if raise_upstream:
+                    raise
+                return None
+        
+        responses = await asyncio.gather(*[delete(batch) for batch in batches])
+        
+        resultados = []
+        for batch, response in zip(batches, responses):
+            if response is None:
+                resultados.extend(
+                    {"inscripcion_id": i, "estado": "error", "error": "Supabase no disponible"} for i in batch
+                )
+                continue
+            if raise_upstream:
+                raise_for_upstream(response, "eliminar inscripciones")
             if response.status_code in [200, 204]:
-                return {"success": True, "message": "Inscripción eliminada"}
+                deleted = {insc["id"] for insc in response.json()} if response.status_code == 200 else set(batch)
+                resultados.extend(
+                    {"inscripcion_id": i, "estado": "eliminada" if i in deleted else "no_encontrada"}
+                    for i in batch
+                )
             else:
-                raise HTTPException(status_code=500, detail=f"Error al eliminar inscripción: {response.text}")
+                error = "Supabase no disponible" if is_failure(response.status_code) else response.text
+                resultados.extend({"inscripcion_id": i, "estado": "error", "error": error} for i in batch)
+        return resultados
+    
+    @staticmethod
+    async def _queued_enroll(schema: str, payloads: List[Dict]) -> List[Dict]:
+        """Lote de inscripciones encoladas: un solo insert (ignora las que ya existen)"""
+        rows = [{"curso_id": p["curso_id"], "usuario_id": p["usuario_id"]} for p in payloads]
+        # Un 5xx lanza UpstreamError para que la cola reintente el lote
+        await CourseController._insert_enrollments(schema, rows, raise_upstream=True)
+        if any(r["estado"] == "inscrito" for r in rows):
+            await invalidate_tenant_responses(schema)
+        return rows
+    
+    @staticmethod
+    async def _queued_delete(schema: str, payloads: List[Dict]) -> List[Dict]:
+        """Lote de eliminaciones encoladas: un DELETE id=in.(...) por bloque"""
+        ids = list(dict.fromkeys(p["inscripcion_id"] for p in payloads))
+        por_id = {r["inscripcion_id"]: r for r in await CourseController._delete_enrollments(schema, ids, raise_upstream=True)}
+        if any(r["estado"] == "eliminada" for r in por_id.values()):
+            await invalidate_tenant_responses(schema)
+        return [por_id[p["inscripcion_id"]] for p in payloads]
+    
+    @staticmethod
+    async def export_courses(ctx: RequestContext, formato: str) -> StreamingResponse:
+        """Exportar el catálogo del tenant (NDJSON/CSV en streaming)"""
+        schema = ctx.schema
+        cursos = _rows(iter_pages(get_supabase_client(), f"{schema}_cursos", {"select": "*"}))
+        rows = await _prime(cursos, "Error al exportar cursos")
+        return export_response(rows, formato, CURSO_FIELDS, f"cursos_{schema}")
+    
+    @staticmethod
+    async def export_course_enrollments(curso_id: int, ctx: RequestContext, formato: str) -> StreamingResponse:
+        """Exportar los inscritos de un curso (solo directores/admin)"""
+        schema = ctx.schema
+        # Exportación completa: primero el permiso, luego recién se lee de Supabase
+        await ctx.require_role()
+        inscritos = CourseController._iter_enrollees(schema, {"curso_id": f"eq.{curso_id}"})
+        rows = await _prime(inscritos, "Error al exportar inscripciones")
+        return export_response(rows, formato, INSCRITO_FIELDS, f"inscritos_{schema}_{curso_id}")
+    
+    @staticmethod
+    async def export_tenant(ctx: RequestContext, formato: str) -> StreamingResponse:
+        """Exportar todos los cursos con todos sus inscritos (solo directores/admin)"""
+        schema = ctx.schema
+        await ctx.require_role()
+        cursos = _rows(iter_pages(get_supabase_client(), f"{schema}_cursos", {"select": "*"}))
+        inscritos = CourseController._iter_enrollees(schema, {})
+        grupos = await _prime(_merge_by_course(cursos, inscritos), "Error al exportar cursos")
+        
+        if formato == "csv":
+            async def flat():
+                async for curso, grupo in grupos:
+                    base = {"curso_id": curso["id"], "codigo": curso.get("codigo"), "curso_nombre": curso.get("nombre")}
+                    if not grupo:
+                        yield base
+                    for inscrito in grupo:
+                        yield {**inscrito, **base}
+            return export_response(flat(), formato, FULL_EXPORT_FIELDS, f"cursos_inscritos_{schema}")
+        
+        async def nested():
+            async for curso, grupo in grupos:
+                yield {**curso, "inscritos": [{k: v for k, v in i.items() if k != "curso_id"} for i in grupo]}
+        return export_response(nested(), formato, [], f"cursos_inscritos_{schema}")
+
+
+# Escrituras asíncronas (WRITE_QUEUE_MODE / Prefer: respond-async)
+write_queue.register("inscribir", CourseController._queued_enroll)
+write_queue.register("eliminar", CourseController._queued_delete)
@@ -1,10 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
 import os
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,11 +17,76 @@ if not all([SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY]):
     raise RuntimeError("Variables de entorno de Supabase no configuradas. Verifica tu archivo .env")
 
 from routes.course_routes import router as course_router
+from routes.admin_routes import router as admin_router
+from utils.cache import init_cache_backend, close_cache_backend
+from utils.metrics import MetricsMiddleware, render as render_metrics
+from utils.resilience import BREAKER_RESET, UpstreamError
+from utils.serialization import FastJSONResponse
+from utils.snapshot import SNAPSHOT_MODE, snapshot_store
+from utils.write_queue import write_queue
+from utils.supabase import close_supabase_client, get_supabase_client, warm_tenant_cache
+
+# Arranque y apagado de cada worker
+PREWARM_TENANTS = os.getenv("PREWARM_TENANTS", "true").lower() in ("1", "true", "yes")
+PREWARM_TIMEOUT = float(os.getenv("PREWARM_TIMEOUT", "10"))
+# true: el worker no acepta tráfico hasta terminar la precarga; false: /health responde
+# de inmediato y /ready devuelve 503 hasta que la precarga termine (en segundo plano)
+PREWARM_BLOCKING = os.getenv("PREWARM_BLOCKING", "false").lower() in ("1", "true", "yes")
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+
+async def warm_up(app: FastAPI):
+    """Precargar cachés y marcar el worker como listo; un fallo no impide arrancar"""
+    app.state.warmup = {"tenants": None, "cursos": None, "error": None}
+    try:
+        if SNAPSHOT_MODE:
+            # Carga tenants y el catálogo de cada uno; luego se actualiza en segundo plano
+            app.state.warmup["cursos"] = await asyncio.wait_for(snapshot_store.start(), PREWARM_TIMEOUT)
+            app.state.warmup["tenants"] = len(snapshot_store.snapshots)
+        elif PREWARM_TENANTS:
+            app.state.warmup["tenants"] = len(await asyncio.wait_for(warm_tenant_cache(), PREWARM_TIMEOUT))
+    except Exception as e:
+        app.state.warmup["error"] = str(e) or type(e).__name__
+        print(f"⚠️ No se pudo precargar tenants: {app.state.warmup['error']}")
+    app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    # Un único pool de conexiones hacia Supabase para toda la app; se abre con la primera llamada
+    app.state.supabase = get_supabase_client()
+    # Caché compartido entre workers (CACHE_BACKEND=redis) o solo en memoria
+    app.state.cache_backend = await init_cache_backend()
+    # Escrituras asíncronas: reencola lo pendiente del journal
+    app.state.write_queue = await write_queue.start()
+    if PREWARM_BLOCKING:
+        await warm_up(app)
+        warm_task = None
+    else:
+        app.state.warmup = {"tenants": None, "cursos": None, "error": None}
+        warm_task = asyncio.create_task(warm_up(app))
+    yield
+    # Apagado ordenado: dejar de anunciarse como listo y esperar las llamadas a Supabase en curso
+    app.state.ready = False
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+        try:
+            await warm_task
+        except asyncio.CancelledError:
+            pass
+    await snapshot_store.stop()
+    if not await write_queue.stop(SHUTDOWN_DRAIN_TIMEOUT):
+        print(f"⚠️ Apagado con {write_queue.stats()['depth']} escrituras en cola")
+    if not await app.state.supabase.drain(SHUTDOWN_DRAIN_TIMEOUT):
+        print(f"⚠️ Apagado con {app.state.supabase.in_flight} llamadas a Supabase en curso")
+    await close_cache_backend()
+    await close_supabase_client()
 
 app = FastAPI(
     title="Courses Microservice",
     version="1.0.0",
-    description="API para gestión de cursos multi-tenant"
+    description="API para gestión de cursos multi-tenant",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS
@@ -36,10 +101,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # El navegador solo expone Server-Timing de otros orígenes si se permite explícitamente
+    expose_headers=["Server-Timing", "ETag"],
 )
 
+# Latencias por ruta y por tabla de Supabase (/metrics y header Server-Timing)
+app.add_middleware(MetricsMiddleware)
+
 # Registrar rutas
 app.include_router(course_router)
+app.include_router(admin_router)
 
 # Endpoints básicos
 @app.get("/")
@@ -58,21 +129,38 @@ async def health():
         "service": "courses"
     }
 
-# Manejo de errores global
-@app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    print(f" Error no controlado: {exc}")
-    return {
-        "error": "Error interno del servidor",
-        "detail": str(exc)
-    }
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 solo cuando terminó la precarga y el worker no se está apagando"""
+    is_ready = getattr(app.state, "ready", False)
+    body = {"status": "ready" if is_ready else "starting", "warmup": getattr(app.state, "warmup", None)}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
+@app.get("/metrics/supabase")
+async def supabase_pool_metrics():
+    """Uso del pool de conexiones hacia Supabase"""
+    return get_supabase_client().stats()
 
-@app.get("/")
-async def root():
-    return {"service": "Courses API", "version": "1.0.0"}
+# Supabase caído o circuito abierto, sin valor en caché para responder
+@app.exception_handler(UpstreamError)
+async def upstream_exception_handler(request, exc):
+    print(f"⚠️ {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Supabase no disponible, intenta nuevamente"},
+        headers={"Retry-After": str(max(1, round(BREAKER_RESET)))}
+    )
 
-@app.get("/health")
-async def health():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+# Manejo de errores global
+@app.exception_handler(Exception)
+async def global_exception_handler(request, exc):
+    print(f"❌ Error no controlado: {exc}")
+    return JSONResponse(
+        status_code=500,
+        content={"error": "Error interno del servidor", "detail": str(exc)}
+    )
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 
 class Course(BaseModel):
     nombre: str
@@ -13,10 +13,18 @@ class CourseEnrollment(BaseModel):
     usuario_id: int
 
 class CourseResponse(BaseModel):
+    """Fila de {schema}_cursos (mismas columnas que CURSO_FIELDS); las nullable en la tabla son Optional"""
+    # Columnas que se agreguen a la tabla se devuelven tal cual
+    model_config = ConfigDict(extra="allow")
+
     id: int
     nombre: str
     codigo: str
     descripcion: Optional[str] = None
-    creditos: int
+    creditos: Optional[int] = None
     horario: Optional[str] = None
-    created_at: str
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class BulkEnrollmentDelete(BaseModel):
+    ids: List[int]
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends
+from typing import Optional
+
+from utils.cache import CACHES, get_cache_backend
+from utils.response_cache import invalidate_tenant_responses
+from utils.supabase import verify_admin_key, invalidate_tenant_cache, invalidate_user_cache
+from utils.snapshot import snapshot_store
+from utils.write_queue import write_queue
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(verify_admin_key)])
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Estadísticas de los cachés (locales y del backend compartido)"""
+    return {**{name: cache.stats() for name, cache in CACHES.items()}, "backend": get_cache_backend().stats()}
+
+@router.get("/write-queue/stats")
+async def write_queue_stats():
+    """Estado de la cola de escrituras asíncronas"""
+    return write_queue.stats()
+
+@router.get("/snapshot/stats")
+async def snapshot_stats():
+    """Estado de los snapshots locales de cursos (SNAPSHOT_MODE)"""
+    return snapshot_store.stats()
+
+@router.post("/snapshot/reload")
+async def reload_snapshot(schema: str):
+    """Recargar por completo el snapshot de un tenant (p. ej. tras cambios hechos fuera de la API)"""
+    snapshot = await snapshot_store.reload(schema)
+    return {"success": True, "schema": schema, "rows": len(snapshot.by_id)}
+
+@router.post("/cache/tenants/invalidate")
+async def invalidate_tenants(domain: Optional[str] = None):
+    """Invalidar el caché de tenants (uno o todos)"""
+    removed = await invalidate_tenant_cache(domain)
+    return {"success": True, "cache": "tenants", "domain": domain, "invalidated": removed}
+
+@router.post("/cache/users/invalidate")
+async def invalidate_users(schema: Optional[str] = None, email: Optional[str] = None):
+    """Invalidar usuarios/roles en caché (lo llama el servicio Roles al cambiar un rol)"""
+    removed = await invalidate_user_cache(schema, email)
+    return {"success": True, "cache": "users", "schema": schema, "email": email, "invalidated": removed}
+
+@router.post("/cache/responses/invalidate")
+async def invalidate_responses(schema: Optional[str] = None):
+    """Invalidar el catálogo y "mis cursos" cacheados de un tenant (o de todos)"""
+    removed = await invalidate_tenant_responses(schema)
+    return {"success": True, "cache": "responses", "schema": schema, "invalidated": removed}
@@ -1,48 +1,122 @@
-from fastapi import APIRouter, Header
-import sys
-import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Optional
 
-# Añadir path para imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from models.course import Course, CourseEnrollment
+from models.course import Course, CourseEnrollment, BulkEnrollmentDelete
 from controllers.course_controller import CourseController
-from utils.supabase import get_current_user
+from utils.bulk import parse_enrollment_rows
+from utils.pagination import MAX_PAGE_SIZE
+from utils.response_cache import json_response
+from utils.serialization import FastJSONResponse
+from utils.context import RequestContext, get_request_context
+from utils.write_queue import wants_async, write_queue
 
 router = APIRouter(prefix="/api/courses", tags=["Courses"])
 
 @router.get("/")
-async def list_courses(authorization: str = Header(None)):
+async def list_courses(
+    request: Request,
+    ctx: RequestContext = Depends(get_request_context),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamaño de página"),
+    after: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    codigo: Optional[str] = Query(None, description="Prefijo del código"),
+    nombre: Optional[str] = Query(None, description="Prefijo del nombre (sin distinguir mayúsculas)")
+):
     """Listar todos los cursos del tenant"""
-    user = await get_current_user(authorization)
-    return await CourseController.list_courses(user["email"])
+    entry = await CourseController.list_courses(
+        ctx, limit=limit, after=after, fields=fields, codigo=codigo, nombre=nombre
+    )
+    return json_response(request, entry)
+
+@router.get("/export")
+async def export_courses(
+    ctx: RequestContext = Depends(get_request_context),
+    formato: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    """Exportar el catálogo completo en streaming (NDJSON o CSV)"""
+    return await CourseController.export_courses(ctx, formato)
+
+@router.get("/export/full")
+async def export_tenant(
+    ctx: RequestContext = Depends(get_request_context),
+    formato: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    """Exportar todos los cursos con sus inscritos (solo directores/admin)"""
+    return await CourseController.export_tenant(ctx, formato)
 
 @router.post("/")
-async def create_course(course: Course, authorization: str = Header(None)):
+async def create_course(course: Course, ctx: RequestContext = Depends(get_request_context)):
     """Crear nuevo curso (solo directores/admin)"""
-    user = await get_current_user(authorization)
-    return await CourseController.create_course(course, user["email"])
+    return await CourseController.create_course(course, ctx)
+
+def _accepted(job: dict) -> FastJSONResponse:
+    """202 con el trabajo encolado y dónde consultar su estado"""
+    status_url = f"{router.prefix}/jobs/{job['id']}"
+    return FastJSONResponse(
+        {"job_id": job["id"], "estado": job["estado"], "status_url": status_url},
+        status_code=202,
+        headers={"Location": status_url}
+    )
 
 @router.post("/enroll")
-async def enroll_course(enrollment: CourseEnrollment, authorization: str = Header(None)):
-    """Inscribir estudiante/profesor en curso"""
-    user = await get_current_user(authorization)
-    return await CourseController.enroll_course(enrollment, user["email"])
+async def enroll_course(request: Request, enrollment: CourseEnrollment, ctx: RequestContext = Depends(get_request_context)):
+    """Inscribir estudiante/profesor en curso (202 + trabajo con "Prefer: respond-async")"""
+    if wants_async(request):
+        return _accepted(await CourseController.enroll_course(enrollment, ctx, asincrono=True))
+    return await CourseController.enroll_course(enrollment, ctx)
+
+@router.post("/enroll/bulk")
+async def bulk_enroll(request: Request, ctx: RequestContext = Depends(get_request_context)):
+    """Inscripción masiva: JSON (lista de {curso_id, usuario_id}) o CSV (text/csv)"""
+    # El rol del usuario se consulta mientras se lee el cuerpo
+    ctx.prefetch_user()
+    rows = await parse_enrollment_rows(request)
+    return await CourseController.bulk_enroll(rows, ctx)
 
 @router.get("/my-courses")
-async def get_my_courses(authorization: str = Header(None)):
+async def get_my_courses(request: Request, ctx: RequestContext = Depends(get_request_context)):
     """Obtener cursos del usuario actual"""
-    user = await get_current_user(authorization)
-    return await CourseController.get_my_courses(user["email"])
+    return json_response(request, await CourseController.get_my_courses(ctx))
 
 @router.get("/{curso_id}/enrollments")
-async def get_course_enrollments(curso_id: int, authorization: str = Header(None)):
+async def get_course_enrollments(
+    curso_id: int,
+    ctx: RequestContext = Depends(get_request_context),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamaño de página"),
+    after: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    fields: Optional[str] = Query(None, description="Campos separados por coma")
+):
     """Obtener estudiantes inscritos en un curso (solo directores/admin)"""
-    user = await get_current_user(authorization)
-    return await CourseController.get_course_enrollments(curso_id, user["email"])
+    # Respuesta ya armada: se serializa directo con orjson, sin pasar por jsonable_encoder
+    return FastJSONResponse(await CourseController.get_course_enrollments(
+        curso_id, ctx, limit=limit, after=after, fields=fields
+    ))
+
+@router.get("/{curso_id}/enrollments/export")
+async def export_course_enrollments(
+    curso_id: int,
+    ctx: RequestContext = Depends(get_request_context),
+    formato: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    """Exportar los inscritos de un curso en streaming (solo directores/admin)"""
+    return await CourseController.export_course_enrollments(curso_id, ctx, formato)
+
+@router.delete("/enrollments/bulk")
+async def bulk_delete_enrollments(body: BulkEnrollmentDelete, ctx: RequestContext = Depends(get_request_context)):
+    """Eliminar varias inscripciones (solo directores/admin)"""
+    return await CourseController.bulk_delete_enrollments(body.ids, ctx)
 
 @router.delete("/enrollments/{inscripcion_id}")
-async def delete_enrollment(inscripcion_id: int, authorization: str = Header(None)):
+async def delete_enrollment(request: Request, inscripcion_id: int, ctx: RequestContext = Depends(get_request_context)):
     """Eliminar inscripción de un curso (solo directores/admin)"""
-    user = await get_current_user(authorization)
-    return await CourseController.delete_enrollment(inscripcion_id, user["email"])
+    if wants_async(request):
+        return _accepted(await CourseController.delete_enrollment(inscripcion_id, ctx, asincrono=True))
+    return await CourseController.delete_enrollment(inscripcion_id, ctx)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, ctx: RequestContext = Depends(get_request_context)):
+    """Estado de una escritura encolada (pendiente, procesando, completado o error)"""
+    job = await write_queue.status(job_id)
+    if job is None or job["schema"] != ctx.schema:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
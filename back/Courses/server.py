@@ -0,0 +1,96 @@
+"""Arranque de producción: varios workers de uvicorn con uvloop/httptools
+
+Uso (desde back/Courses):
+    python server.py
+
+Toda la configuración es por variables de entorno (ver README.md).
+"""
+import importlib.util
+import math
+import os
+from typing import Optional
+
+import uvicorn
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _disponible(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _cgroup_quota() -> Optional[float]:
+    """CPUs permitidos por la cuota de cgroup (v2 o v1); None si no hay límite"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _cpus_disponibles() -> int:
+    """Núcleos que el contenedor puede usar: afinidad del proceso acotada por la cuota de cgroup
+    (os.cpu_count() devuelve los del host aunque el contenedor esté limitado a 1-2 CPUs)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - sin sched_getaffinity (macOS)
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5000"))
+# Un worker por núcleo disponible para el contenedor salvo que se indique otra cosa
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY") or _cpus_disponibles())
+# Cola de conexiones pendientes del socket (picos de tráfico)
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+# Debe superar el idle timeout del balanceador para que no corte conexiones reutilizables
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "75"))
+# Segundos para terminar requests en curso al recibir SIGTERM
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Máximo de conexiones simultáneas por worker antes de responder 503 (vacío = sin límite)
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY")) if os.getenv("LIMIT_CONCURRENCY") else None
+ACCESS_LOG = _env_bool("ACCESS_LOG", "false")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+LOOP = "uvloop" if _disponible("uvloop") else "asyncio"
+HTTP = "httptools" if _disponible("httptools") else "h11"
+
+
+def main():
+    print(f"🚀 Courses API: {WEB_CONCURRENCY} workers en {HOST}:{PORT} (loop={LOOP}, http={HTTP})")
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop=LOOP,
+        http=HTTP,
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        limit_concurrency=LIMIT_CONCURRENCY,
+        access_log=ACCESS_LOG,
+        log_level=LOG_LEVEL,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import codecs
+import csv
+import json
+import os
+from typing import AsyncIterator, Dict, List
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+from models.course import CourseEnrollment
+
+# Máximo de filas aceptadas en una operación masiva
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "5000"))
+
+
+def _parse_row(fila: int, data) -> Dict:
+    """Validar una fila; los errores quedan en el reporte en vez de abortar todo"""
+    try:
+        enrollment = CourseEnrollment.model_validate(data)
+        return {"fila": fila, "curso_id": enrollment.curso_id, "usuario_id": enrollment.usuario_id}
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        row = {"fila": fila, "curso_id": None, "usuario_id": None, "error": errors}
+        if isinstance(data, dict):
+            row["curso_id"] = data.get("curso_id")
+            row["usuario_id"] = data.get("usuario_id")
+        return row
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    """Leer el cuerpo como líneas de texto a medida que llega"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _parse_csv(request: Request) -> List[Dict]:
+    rows: List[Dict] = []
+    header = None
+    async for line in _iter_lines(request):
+        line = line.strip()
+        if not line:
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            # La cabecera es opcional: si no hay, se asume curso_id,usuario_id
+            header = [v.strip().lower() for v in values]
+            if {"curso_id", "usuario_id"} <= set(header):
+                continue
+            header = ["curso_id", "usuario_id"]
+        rows.append(_parse_row(len(rows) + 1, dict(zip(header, (v.strip() for v in values)))))
+        if len(rows) > BULK_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ROWS} filas por solicitud")
+    return rows
+
+
+async def parse_enrollment_rows(request: Request) -> List[Dict]:
+    """Leer inscripciones masivas desde JSON (lista u {"inscripciones": [...]}) o CSV"""
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        rows = await _parse_csv(request)
+    else:
+        try:
+            data = json.loads(await request.body() or b"null")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if isinstance(data, dict):
+            data = data.get("inscripciones")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="Se esperaba una lista de inscripciones")
+        if len(data) > BULK_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ROWS} filas por solicitud")
+        rows = [_parse_row(i + 1, item) for i, item in enumerate(data)]
+    if not rows:
+        raise HTTPException(status_code=400, detail="No se recibieron inscripciones")
+    return rows
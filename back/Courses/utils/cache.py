@@ -0,0 +1,273 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from utils.cache_backend import MemoryBackend, create_backend, decode_key, key_matches
+
+# Registro de cachés para exponer estadísticas e invalidación
+CACHES: Dict[str, "TTLCache"] = {}
+
+_MISSING = object()
+
+# Capa compartida entre workers (memoria = sin capa compartida)
+_backend = MemoryBackend()
+
+
+def get_cache_backend():
+    return _backend
+
+
+def _apply_remote_invalidation(message: Dict):
+    """Invalidación publicada por otro worker: solo se limpia el caché local"""
+    cache = CACHES.get(message.get("cache"))
+    if cache is None:
+        return
+    if message.get("key") is not None:
+        cache.invalidate(decode_key(message["key"]))
+    elif message.get("pattern") is not None:
+        pattern = tuple(message["pattern"])
+        cache.invalidate_where(lambda key: key_matches(key, pattern))
+    else:
+        cache.invalidate()
+
+
+async def init_cache_backend(backend=None):
+    """Conectar el backend configurado (CACHE_BACKEND) y escuchar invalidaciones"""
+    global _backend
+    candidate = backend or create_backend()
+    try:
+        await candidate.start(_apply_remote_invalidation)
+    except Exception as e:
+        print(f"⚠️ No se pudo iniciar el caché compartido ({candidate.name}): {e}; usando memoria")
+        await candidate.close()
+        candidate = MemoryBackend()
+    _backend = candidate
+    return _backend
+
+
+async def close_cache_backend():
+    global _backend
+    await _backend.close()
+    _backend = MemoryBackend()
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, default=str).encode()
+
+
+class TTLCache:
+    """Caché en memoria con TTL, tamaño máximo (LRU) y coalescing de cargas"""
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        maxsize: int = 1024,
+        negative_ttl: Optional[float] = None,
+        stale_ttl: float = 0,
+        shared: bool = False,
+        encode: Callable[[Any], bytes] = _json_dumps,
+        decode: Callable[[bytes], Any] = json.loads,
+        fallback_ttl: float = 0,
+        fallback_on: Tuple[type, ...] = (),
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # TTL para resultados vacíos (None); None desactiva el caché negativo
+        self.negative_ttl = negative_ttl
+        # Tiempo extra en que un valor vencido se sirve mientras se recarga en segundo plano
+        self.stale_ttl = stale_ttl
+        # Compartido: se lee/escribe también en el backend y se publican las invalidaciones
+        self.shared = shared
+        self.encode = encode
+        self.decode = decode
+        # Tiempo extra en que un valor vencido se conserva para responder si la recarga falla
+        # con alguna de las excepciones de fallback_on (p. ej. Supabase caído)
+        self.fallback_ttl = fallback_ttl if fallback_on else 0
+        self.fallback_on = fallback_on
+        # clave -> (valor, vence_en, stale_hasta, conservar_hasta)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, float, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        # Se incrementa al invalidar para descartar cargas iniciadas antes
+        self._generation = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.fallback_hits = 0
+
+        CACHES[name] = self
+
+    def _lookup(self, key: Hashable) -> Tuple[Any, bool]:
+        """Devuelve (valor o _MISSING, es_stale)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING, False
+        value, expires_at, stale_until, keep_until = entry
+        now = time.monotonic()
+        if keep_until <= now:
+            del self._data[key]
+            return _MISSING, False
+        if stale_until <= now:
+            return _MISSING, False
+        self._data.move_to_end(key)
+        return value, expires_at <= now
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Devuelve (encontrado, valor) respetando el TTL"""
+        value, stale = self._lookup(key)
+        if value is _MISSING or stale:
+            return False, None
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl is None or ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl
+        stale_until = expires_at + self.stale_ttl
+        self._data[key] = (value, expires_at, stale_until, stale_until + self.fallback_ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable = _MISSING) -> int:
+        """Eliminar una clave (o todo el caché si no se indica)"""
+        self._generation += 1
+        if key is _MISSING:
+            count = len(self._data)
+            self._data.clear()
+            return count
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Eliminar todas las claves que cumplan el predicado"""
+        self._generation += 1
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    async def evict(self, key: Hashable = _MISSING) -> int:
+        """Invalidar en este worker, en el backend compartido y en los demás workers"""
+        removed = self.invalidate(key)
+        if self.shared and _backend.shared:
+            shared_key = None if key is _MISSING else key
+            await _backend.delete(self.name, key=shared_key)
+            await _backend.publish(self.name, key=shared_key)
+        return removed
+
+    async def evict_matching(self, pattern: Tuple) -> int:
+        """Como evict, para las claves que empiezan con el patrón (None = comodín)"""
+        removed = self.invalidate_where(lambda key: key_matches(key, pattern))
+        if self.shared and _backend.shared:
+            await _backend.delete(self.name, pattern=pattern)
+            await _backend.publish(self.name, pattern=pattern)
+        return removed
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Obtener del caché o cargar una sola vez aunque haya llamadas concurrentes"""
+        value, stale = self._lookup(key)
+        if value is not _MISSING:
+            if not stale:
+                self.hits += 1
+                return value
+            # Stale-while-revalidate: responder ya y recargar en segundo plano
+            self.stale_hits += 1
+            if key not in self._inflight:
+                task = asyncio.ensure_future(self._refresh(key, loader))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return value
+        self.misses += 1
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        return await self._load(key, loader)
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        try:
+            await self._load(key, loader)
+        except Exception as e:
+            print(f"⚠️ Error recargando caché {self.name}: {e}")
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            self.loads += 1
+            value, ttl = await self._read_through(key, loader, generation)
+            if generation == self._generation:
+                self.set(key, value, ttl=ttl)
+            future.set_result(value)
+            return value
+        except self.fallback_on as exc:
+            fallback = self._fallback(key)
+            if fallback is _MISSING:
+                future.set_exception(exc)
+                future.exception()
+                raise
+            print(f"⚠️ Caché {self.name}: sirviendo valor vencido ({exc})")
+            future.set_result(fallback)
+            return fallback
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Evitar "Future exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _fallback(self, key: Hashable) -> Any:
+        """Valor vencido pero todavía conservado para la clave, o _MISSING"""
+        entry = self._data.get(key)
+        if entry is None or entry[3] <= time.monotonic():
+            return _MISSING
+        self.fallback_hits += 1
+        return entry[0]
+
+    async def _read_through(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> Tuple[Any, Optional[float]]:
+        """Buscar en el backend compartido antes de llamar al loader; devuelve (valor, ttl restante)"""
+        if not (self.shared and _backend.shared):
+            return await loader(), None
+        found = await _backend.get(self.name, key)
+        if found is not None:
+            raw, remaining = found
+            self.shared_hits += 1
+            return self.decode(raw), remaining
+        value = await loader()
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl and generation == self._generation:
+            await _backend.set(self.name, key, self.encode(value), ttl)
+        return value, None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "shared": self.shared and _backend.shared,
+            "shared_hits": self.shared_hits,
+            "fallback_hits": self.fallback_hits,
+        }
@@ -0,0 +1,211 @@
+import asyncio
+import importlib.util
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# redis solo se importa si se usa (CACHE_BACKEND=redis): ahorra tiempo de arranque
+REDIS_DISPONIBLE = importlib.util.find_spec("redis") is not None
+
+# memory: cada worker con su propio caché | redis: capa compartida + invalidación por pub/sub
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "courses")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+
+
+def encode_key(key: Hashable) -> str:
+    return json.dumps(list(key) if isinstance(key, tuple) else key, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode_key(raw: str) -> Hashable:
+    key = json.loads(raw)
+    return tuple(key) if isinstance(key, list) else key
+
+
+def key_matches(key: Hashable, pattern: Tuple) -> bool:
+    """La clave empieza con el patrón (None = comodín, texto sin distinguir mayúsculas)"""
+    parts = key if isinstance(key, tuple) else (key,)
+    if len(parts) < len(pattern):
+        return False
+    for part, expected in zip(parts, pattern):
+        if expected is None:
+            continue
+        if isinstance(part, str) and isinstance(expected, str):
+            if part.casefold() != expected.casefold():
+                return False
+        elif part != expected:
+            return False
+    return True
+
+
+class MemoryBackend:
+    """Sin capa compartida: cada proceso usa solo su caché local"""
+    name = "memory"
+    shared = False
+
+    async def start(self, on_invalidate: Callable[[Dict], None]):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, cache: str, key: Hashable) -> Optional[Tuple[bytes, float]]:
+        return None
+
+    async def set(self, cache: str, key: Hashable, value: bytes, ttl: float):
+        pass
+
+    async def delete(self, cache: str, key: Any = None, pattern: Optional[Tuple] = None) -> int:
+        return 0
+
+    async def publish(self, cache: str, key: Any = None, pattern: Optional[Tuple] = None):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class RedisBackend:
+    """Caché compartido entre workers/réplicas en un servidor Redis (o compatible)"""
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = CACHE_PREFIX, timeout: float = REDIS_TIMEOUT):
+        if not REDIS_DISPONIBLE:
+            raise RuntimeError("CACHE_BACKEND=redis requiere el paquete redis")
+        import redis.asyncio as aioredis
+        self.url = url
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidate"
+        # Identifica a este proceso para ignorar sus propios mensajes de invalidación
+        self.origin = uuid.uuid4().hex
+        self.client = aioredis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.deletes = 0
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def _key(self, cache: str, key: Hashable) -> str:
+        return f"{self.prefix}:{cache}:{encode_key(key)}"
+
+    def _error(self, action: str, e: Exception):
+        # Redis caído no debe tumbar requests: se sigue con el caché local
+        self.errors += 1
+        print(f"⚠️ Error de caché compartido ({action}): {e}")
+
+    async def start(self, on_invalidate: Callable[[Dict], None]):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(on_invalidate))
+
+    async def _listen(self, on_invalidate: Callable[[Dict], None]):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None or message["type"] != "message":
+                    continue
+                data = json.loads(message["data"])
+                if data.get("origin") == self.origin:
+                    continue
+                self.received += 1
+                on_invalidate(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._error("pub/sub", e)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.client.aclose()
+
+    async def get(self, cache: str, key: Hashable) -> Optional[Tuple[bytes, float]]:
+        """(valor, segundos restantes) o None"""
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                value, pttl = await pipe.get(self._key(cache, key)).pttl(self._key(cache, key)).execute()
+        except Exception as e:
+            self._error("get", e)
+            return None
+        if value is None or pttl is None or pttl <= 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value, pttl / 1000
+
+    async def set(self, cache: str, key: Hashable, value: bytes, ttl: float):
+        try:
+            await self.client.set(self._key(cache, key), value, px=max(int(ttl * 1000), 1))
+            self.sets += 1
+        except Exception as e:
+            self._error("set", e)
+
+    async def delete(self, cache: str, key: Any = None, pattern: Optional[Tuple] = None) -> int:
+        """Borrar una clave, las que cumplan el patrón, o todo el caché (sin key ni patrón)"""
+        try:
+            if key is not None:
+                keys = [self._key(cache, key)]
+            else:
+                base = f"{self.prefix}:{cache}:"
+                keys = []
+                async for raw in self.client.scan_iter(match=f"{base}*", count=500):
+                    raw = raw.decode() if isinstance(raw, bytes) else raw
+                    if pattern is None or key_matches(decode_key(raw[len(base):]), pattern):
+                        keys.append(raw)
+            if not keys:
+                return 0
+            removed = await self.client.delete(*keys)
+            self.deletes += removed
+            return removed
+        except Exception as e:
+            self._error("delete", e)
+            return 0
+
+    async def publish(self, cache: str, key: Any = None, pattern: Optional[Tuple] = None):
+        message = {
+            "origin": self.origin,
+            "cache": cache,
+            "key": encode_key(key) if key is not None else None,
+            "pattern": list(pattern) if pattern is not None else None,
+        }
+        try:
+            await self.client.publish(self.channel, json.dumps(message, ensure_ascii=False))
+            self.published += 1
+        except Exception as e:
+            self._error("publish", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "deletes": self.deletes,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+def create_backend(kind: str = CACHE_BACKEND):
+    """Backend según CACHE_BACKEND; sin el paquete redis se usa memoria"""
+    if kind == "redis":
+        if REDIS_DISPONIBLE:
+            return RedisBackend()
+        print("⚠️ CACHE_BACKEND=redis pero el paquete redis no está instalado; usando memoria")
+    return MemoryBackend()
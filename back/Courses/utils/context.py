@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, Optional, Sequence
+
+from fastapi import Depends, HTTPException, Request
+
+from utils.supabase import get_current_user, get_tenant_info, get_user_by_email
+
+# Roles con permisos de administración del tenant
+ADMIN_ROLES = ("director", "admin")
+
+
+@dataclass
+class RequestContext:
+    """Tenant y usuario resueltos una sola vez por request"""
+    email: str
+    user_id: Optional[str]
+    tenant_domain: str
+    tenant: Dict
+    _user_task: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    @property
+    def schema(self) -> str:
+        return self.tenant["schema_name"]
+
+    def prefetch_user(self) -> "RequestContext":
+        """Empezar a buscar el usuario sin esperar el resultado"""
+        if self._user_task is None:
+            self._user_task = asyncio.ensure_future(get_user_by_email(self.email, self.schema))
+            # Si nadie llega a esperarla (p. ej. el body era inválido) no dejar la excepción sin leer
+            self._user_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self
+
+    async def user(self) -> Optional[Dict]:
+        """Usuario del tenant ({schema}_usuarios) o None"""
+        return await self.prefetch_user()._user_task
+
+    async def require_user(self) -> Dict:
+        user_data = await self.user()
+        if not user_data:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        return user_data
+
+    async def require_role(self, roles: Sequence[str] = ADMIN_ROLES, detail: str = "No tienes permisos") -> Dict:
+        user_data = await self.user()
+        if not user_data or user_data.get("rol") not in roles:
+            raise HTTPException(status_code=403, detail=detail)
+        return user_data
+
+    async def authorized(self, work: Awaitable[Any], roles: Sequence[str] = ADMIN_ROLES, detail: str = "No tienes permisos") -> Any:
+        """Ejecutar una lectura en paralelo con la verificación de rol (se descarta si no autoriza)
+
+        Solo para lecturas baratas; la consulta sale hacia Supabase aunque luego se rechace.
+        """
+        task = asyncio.ensure_future(work)
+        try:
+            await self.require_role(roles, detail)
+        except BaseException:
+            task.cancel()
+            # Esperarla para que su excepción (si ya terminó con error) no quede sin leer
+            with contextlib.suppress(BaseException):
+                await task
+            raise
+        return await task
+
+
+async def get_request_context(request: Request, user: Dict = Depends(get_current_user)) -> RequestContext:
+    """Dependencia: resuelve el tenant (con caché) y deja el contexto en request.state"""
+    ctx = getattr(request.state, "context", None)
+    if ctx is not None:
+        return ctx
+
+    tenant_domain = user.get("tenant_domain")
+    if not tenant_domain:
+        raise HTTPException(status_code=400, detail="Tenant no identificado")
+
+    tenant_info = await get_tenant_info(tenant_domain)
+    if not tenant_info:
+        raise HTTPException(status_code=404, detail="Tenant no encontrado")
+
+    ctx = RequestContext(
+        email=user["email"],
+        user_id=user.get("user_id"),
+        tenant_domain=tenant_domain,
+        tenant=tenant_info,
+    )
+    request.state.tenant = tenant_info
+    request.state.context = ctx
+    return ctx
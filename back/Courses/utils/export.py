@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+from fastapi.responses import StreamingResponse
+
+from utils.pagination import quote
+from utils.serialization import dumps
+from utils.supabase_client import SupabaseClient
+
+# Filas por página al leer desde Supabase durante una exportación
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class ExportError(Exception):
+    """Respuesta no exitosa de Supabase durante una exportación"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Supabase respondió {response.status_code}")
+        self.response = response
+
+
+def _literal(value: Any) -> str:
+    return str(value) if isinstance(value, int) else quote(value)
+
+
+def _keyset_filter(keys: Sequence[str], last: Dict) -> Dict[str, str]:
+    """Filtro para continuar después de la última fila (orden por una o dos columnas)"""
+    if len(keys) == 1:
+        return {keys[0]: f"gt.{last[keys[0]]}"}
+    first, second = keys
+    a, b = _literal(last[first]), _literal(last[second])
+    return {"or": f"({first}.gt.{a},and({first}.eq.{a},{second}.gt.{b}))"}
+
+
+async def iter_pages(
+    client: SupabaseClient,
+    table: str,
+    params: Dict[str, str],
+    keys: Sequence[str] = ("id",),
+    page_size: int = EXPORT_PAGE_SIZE,
+    service_role: bool = False,
+) -> AsyncIterator[List[Dict]]:
+    """Recorrer una tabla por páginas (keyset) sin cargarla completa en memoria"""
+    last: Optional[Dict] = None
+    while True:
+        page_params = {**params, "order": ",".join(f"{k}.asc" for k in keys), "limit": str(page_size)}
+        if last is not None:
+            page_params.update(_keyset_filter(keys, last))
+        response = await client.get(table, params=page_params, service_role=service_role)
+        if response.status_code != 200:
+            raise ExportError(response)
+        page = response.json()
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+async def prime(rows: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Leer el primer elemento antes de responder, para que los errores lleguen como HTTP 4xx/5xx"""
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        async def empty():
+            return
+            yield
+        return empty()
+
+    async def chained():
+        yield first
+        async for row in rows:
+            yield row
+    return chained()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+async def ndjson_lines(rows: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield dumps(row) + b"\n"
+
+
+async def csv_lines(rows: AsyncIterator[Dict], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow([_csv_value(row.get(c)) for c in columns])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(rows: AsyncIterator[Dict], formato: str, columns: Sequence[str], filename: str) -> StreamingResponse:
+    """StreamingResponse NDJSON o CSV a partir de un generador de filas"""
+    body = csv_lines(rows, columns) if formato == "csv" else ndjson_lines(rows)
+    extension = "csv" if formato == "csv" else "ndjson"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
@@ -0,0 +1,271 @@
+import bisect
+import contextvars
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.cache import CACHES
+from utils.supabase_client import add_upstream_hook
+
+# Buckets de latencia (segundos), pensados para llamadas HTTP de 1 ms a 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+# Métricas registradas, en el orden en que se exportan
+REGISTRY: List = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Contador; con collect el valor se lee de una función al exportar"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.values: Dict[LabelValues, float] = defaultdict(float)
+        self.collect = collect
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] += amount
+
+    def render(self) -> List[str]:
+        if self.collect is not None:
+            self.values = defaultdict(float, self.collect())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(self.values.items())]
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.values[labels] -= amount
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        # etiquetas -> [conteos por bucket..., +Inf], suma
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = defaultdict(float)
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# ─── Tiempos por request (Server-Timing) ─────────────────────
+
+class RequestTimings:
+    """Tiempo acumulado de llamadas a Supabase por tabla durante un request"""
+    __slots__ = ("upstream",)
+
+    def __init__(self):
+        self.upstream: Dict[str, List[float]] = {}
+
+    def add(self, table: str, seconds: float):
+        entry = self.upstream.setdefault(table, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def header(self, total: float) -> str:
+        parts = [f"total;dur={total * 1000:.1f}"]
+        for table, (count, seconds) in self.upstream.items():
+            parts.append(f'sb-{table};dur={seconds * 1000:.1f};desc="{count} llamadas"')
+        return ", ".join(parts)
+
+
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def table_kind(table: str) -> str:
+    """tenant_ucb_cursos -> cursos (evita una serie por tenant)"""
+    return table.rsplit("_", 1)[-1] if "_" in table else table
+
+
+# ─── Métricas ────────────────────────────────────────────────
+
+http_requests = Counter("http_requests_total", "Requests HTTP atendidos", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "Duración de requests HTTP", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests HTTP en curso")
+http_in_flight.inc(amount=0)
+
+upstream_requests = Counter("supabase_requests_total", "Llamadas a Supabase", ("table", "method", "status"))
+upstream_duration = Histogram("supabase_request_duration_seconds", "Duración de llamadas a Supabase", ("table", "method"))
+
+
+def _supabase_pool() -> Dict[LabelValues, float]:
+    from utils.supabase import get_supabase_client
+    stats = get_supabase_client().stats()
+    return {(key,): float(stats[key]) for key in ("in_flight", "connections", "connections_active", "connections_idle")}
+
+
+def _cache_stat(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    return lambda: {(name,): float(cache.stats()[field]) for name, cache in CACHES.items()}
+
+
+Gauge("supabase_pool", "Estado del pool de conexiones hacia Supabase", ("stat",), collect=_supabase_pool)
+Counter("cache_hits_total", "Aciertos de caché (incluye stale)", ("cache",),
+        collect=lambda: {(n,): float(c.hits + c.stale_hits) for n, c in CACHES.items()})
+Counter("cache_misses_total", "Fallos de caché", ("cache",), collect=_cache_stat("misses"))
+Gauge("cache_hit_ratio", "Proporción de aciertos de caché", ("cache",), collect=_cache_stat("hit_ratio"))
+Gauge("cache_size", "Entradas en caché", ("cache",), collect=_cache_stat("size"))
+Counter("cache_fallback_hits_total", "Valores vencidos servidos porque Supabase falló", ("cache",),
+        collect=_cache_stat("fallback_hits"))
+
+
+_BREAKER_STATES = {"closed": 0.0, "half_open": 1.0, "open": 2.0}
+
+
+def _breakers() -> Dict[LabelValues, float]:
+    from utils.supabase import get_supabase_client
+    states: Dict[LabelValues, float] = {}
+    # Peor estado entre los tenants de cada tipo de tabla
+    for table, breaker in get_supabase_client().breakers.items():
+        key = (table_kind(table),)
+        states[key] = max(states.get(key, 0.0), _BREAKER_STATES[breaker.state])
+    return states
+
+
+def _resilience() -> Dict[LabelValues, float]:
+    from utils.supabase import get_supabase_client
+    stats = get_supabase_client().stats()
+    return {("retry",): float(stats["retries_total"]), ("hedge",): float(stats["hedged_total"]),
+            ("bulkhead_rejected",): float(stats["bulkhead"]["rejected"])}
+
+
+def _singleflight(index: int) -> Callable[[], Dict[LabelValues, float]]:
+    def collect() -> Dict[LabelValues, float]:
+        from utils.supabase import get_supabase_client
+        values: Dict[LabelValues, float] = defaultdict(float)
+        for table, counts in get_supabase_client().singleflight.by_label().items():
+            values[(table_kind(table),)] += counts[index]
+        return values
+    return collect
+
+
+def _singleflight_fan_in() -> Dict[LabelValues, float]:
+    executed, shared = _singleflight(0)(), _singleflight(1)()
+    return {key: (count + shared.get(key, 0.0)) / count for key, count in executed.items() if count}
+
+
+Counter("supabase_singleflight_executed_total", "GETs a Supabase ejecutados (líderes)", ("table",),
+        collect=_singleflight(0))
+Counter("supabase_singleflight_shared_total", "GETs que reutilizaron una llamada idéntica en curso", ("table",),
+        collect=_singleflight(1))
+Gauge("supabase_singleflight_fan_in", "Lecturas atendidas por cada GET real a Supabase", ("table",),
+      collect=_singleflight_fan_in)
+
+
+def _write_queue() -> Dict[LabelValues, float]:
+    from utils.write_queue import write_queue
+    stats = write_queue.stats()
+    values = {("depth",): float(stats["depth"]), ("submitted",): float(stats["submitted"]),
+              ("rejected",): float(stats["rejected"]), ("batches",): float(stats["batches"]),
+              ("retried",): float(stats["retried"])}
+    values.update({(f"finished_{estado}",): float(n) for estado, n in stats["finished"].items()})
+    return values
+
+
+def _snapshot(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect() -> Dict[LabelValues, float]:
+        from utils.snapshot import snapshot_store
+        return {(schema,): float(info[field]) for schema, info in snapshot_store.stats()["tenants"].items()}
+    return collect
+
+
+Gauge("snapshot_rows", "Cursos en el snapshot local por tenant", ("tenant",), collect=_snapshot("rows"))
+Gauge("snapshot_age_seconds", "Segundos desde la última actualización del snapshot", ("tenant",),
+      collect=_snapshot("age"))
+Gauge("write_queue", "Cola de escrituras asíncronas: profundidad, trabajos y lotes", ("stat",), collect=_write_queue)
+Gauge("supabase_circuit_state", "Circuito hacia Supabase por tabla (0 cerrado, 1 semiabierto, 2 abierto)",
+      ("table",), collect=_breakers)
+Counter("supabase_resilience_total", "Reintentos, hedges y rechazos por bulkhead", ("event",), collect=_resilience)
+
+
+def _observe_upstream(method: str, table: str, status: Optional[int], seconds: float):
+    kind = table_kind(table)
+    upstream_requests.inc(kind, method, str(status) if status is not None else "error")
+    upstream_duration.observe(seconds, kind, method)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(kind, seconds)
+
+
+add_upstream_hook(_observe_upstream)
+
+
+def render() -> str:
+    """Todas las métricas en formato de texto de Prometheus"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia y estado por ruta, requests en curso y header Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+        http_in_flight.inc()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header(time.perf_counter() - start).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            http_in_flight.dec()
+            _timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(scope["method"], path, str(status))
+            http_duration.observe(time.perf_counter() - start, scope["method"], path)
@@ -0,0 +1,53 @@
+import base64
+import json
+from typing import Any, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+# Límite máximo de filas por página
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(*values: Any) -> str:
+    """Cursor opaco (base64url) con los valores de la última fila de la página"""
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """Decodificar un cursor de encode_cursor convirtiendo cada valor al tipo indicado"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor con forma inesperada")
+        return [cast(value) for cast, value in zip(types, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def quote(value: Any) -> str:
+    """Escapar un valor para usarlo dentro de filtros or=(...) de PostgREST"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def like_prefix(prefix: str) -> str:
+    """Patrón LIKE de PostgREST para 'empieza con', sin comodines del usuario"""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "")
+    return f"{escaped}*"
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], required: Iterable[str] = ()) -> Optional[List[str]]:
+    """Validar fields=a,b,c contra las columnas permitidas (None = todas)"""
+    if not fields:
+        return None
+    allowed = list(allowed)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    invalid = [f for f in selected if f not in allowed]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Campos no permitidos: {', '.join(invalid)}")
+    for field in required:
+        if field not in selected:
+            selected.append(field)
+    return list(dict.fromkeys(selected))
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict
+
+
+class UpstreamError(Exception):
+    """Supabase no respondió correctamente (error de red o 5xx)"""
+
+
+class UpstreamUnavailable(UpstreamError):
+    """Llamada rechazada sin intentar: circuito abierto o tenant sin capacidad"""
+
+
+# Reintentos (solo métodos idempotentes)
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", "2"))
+SUPABASE_RETRY_BACKOFF = float(os.getenv("SUPABASE_RETRY_BACKOFF", "0.05"))
+SUPABASE_RETRY_BACKOFF_MAX = float(os.getenv("SUPABASE_RETRY_BACKOFF_MAX", "1"))
+RETRY_METHODS = frozenset({"GET", "HEAD"})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# Circuit breaker por tabla
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))
+
+# Bulkhead: llamadas simultáneas por tenant y espera máxima por un lugar
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "32"))
+BULKHEAD_TIMEOUT = float(os.getenv("BULKHEAD_TIMEOUT", "2"))
+
+# Hedging de GETs: segundo intento si el primero tarda más que esto (0 = desactivado)
+SUPABASE_HEDGE_DELAY = float(os.getenv("SUPABASE_HEDGE_DELAY", "0"))
+
+# Segundos que un valor vencido se conserva en caché para responder si Supabase falla
+STALE_IF_ERROR_TTL = float(os.getenv("STALE_IF_ERROR_TTL", "900"))
+
+
+def backoff(attempt: int) -> float:
+    """Espera antes del reintento attempt (full jitter exponencial)"""
+    return random.uniform(0, min(SUPABASE_RETRY_BACKOFF_MAX, SUPABASE_RETRY_BACKOFF * 2 ** attempt))
+
+
+def is_failure(status: int) -> bool:
+    """Respuestas que cuentan como fallo de Supabase (no de la petición)"""
+    return status >= 500
+
+
+def raise_for_upstream(response, what: str):
+    """UpstreamError si Supabase respondió con un fallo propio (5xx)"""
+    if is_failure(response.status_code):
+        raise UpstreamError(f"Supabase respondió {response.status_code} al {what}")
+
+
+class CircuitBreaker:
+    """Cerrado → abierto tras N fallos seguidos → semiabierto (una sonda) tras BREAKER_RESET"""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+        self._probing = False
+        self.rejected = 0
+
+    def before_call(self):
+        """Lanza UpstreamUnavailable si el circuito no deja pasar la llamada"""
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        raise UpstreamUnavailable(f"Circuito abierto para {self.name}")
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self._probing = False
+
+    def abort(self):
+        """La llamada terminó sin resultado (cancelada): liberar la sonda"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"⚠️ Circuito abierto para {self.name} tras {self.failures} fallos")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class Bulkhead:
+    """Límite de llamadas simultáneas por clave (tenant), para que uno lento no agote el pool"""
+
+    def __init__(self, limit: int = TENANT_MAX_CONCURRENCY, timeout: float = BULKHEAD_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.rejected = 0
+
+    def slot(self, key: str) -> "_Slot":
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.limit)
+        return _Slot(self, key, semaphore)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "rejected": self.rejected,
+            "in_use": {key: self.limit - s._value for key, s in self._semaphores.items() if s._value < self.limit},
+        }
+
+
+class _Slot:
+    __slots__ = ("bulkhead", "key", "semaphore")
+
+    def __init__(self, bulkhead: Bulkhead, key: str, semaphore: asyncio.Semaphore):
+        self.bulkhead, self.key, self.semaphore = bulkhead, key, semaphore
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.bulkhead.timeout)
+        except asyncio.TimeoutError:
+            self.bulkhead.rejected += 1
+            raise UpstreamUnavailable(f"Tenant {self.key} sin capacidad hacia Supabase")
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
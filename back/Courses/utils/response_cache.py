@@ -0,0 +1,80 @@
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+
+from utils.cache import TTLCache
+from utils.resilience import STALE_IF_ERROR_TTL, UpstreamError
+from utils.serialization import dumps
+
+# Respuestas ya serializadas del catálogo (por tenant) y de "mis cursos" (por usuario)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "2048"))
+# max-age para el navegador; con 0 el cliente revalida siempre con If-None-Match
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "0"))
+
+
+class CachedJSON:
+    """Cuerpo JSON serializado una vez, con su ETag"""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_data(cls, data: Any) -> "CachedJSON":
+        return cls(dumps(data))
+
+
+# En el backend compartido se guarda el cuerpo tal cual; el ETag se recalcula al leer.
+# Si Supabase no responde se sirve la última versión conocida (STALE_IF_ERROR_TTL).
+catalog_cache = TTLCache(
+    "catalogo", ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_MAXSIZE,
+    shared=True, encode=lambda entry: entry.body, decode=CachedJSON,
+    fallback_ttl=STALE_IF_ERROR_TTL, fallback_on=(UpstreamError,)
+)
+my_courses_cache = TTLCache(
+    "mis_cursos", ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_MAXSIZE,
+    shared=True, encode=lambda entry: entry.body, decode=CachedJSON,
+    fallback_ttl=STALE_IF_ERROR_TTL, fallback_on=(UpstreamError,)
+)
+
+
+async def cached_json(cache: TTLCache, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> CachedJSON:
+    """Obtener la respuesta del caché o generarla con loader (una sola carga concurrente)
+
+    loader puede devolver datos a serializar o un CachedJSON ya armado (passthrough).
+    """
+    async def load() -> CachedJSON:
+        data = await loader()
+        return data if isinstance(data, CachedJSON) else CachedJSON.from_data(data)
+    return await cache.get_or_load(key, load)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def json_response(request: Request, entry: CachedJSON) -> Response:
+    """200 con el cuerpo cacheado, o 304 si el cliente ya tiene esa versión"""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"private, max-age={RESPONSE_CACHE_MAX_AGE}, must-revalidate",
+        "Vary": "Authorization",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+async def invalidate_tenant_responses(schema: Optional[str] = None) -> Dict[str, int]:
+    """Descartar las respuestas cacheadas de un tenant (o de todos) tras una escritura"""
+    return {
+        "catalogo": await catalog_cache.evict_matching((schema,)),
+        "mis_cursos": await my_courses_cache.evict_matching((schema,)),
+    }
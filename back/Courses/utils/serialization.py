@@ -0,0 +1,39 @@
+import json
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+    ORJSON_DISPONIBLE = False
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if ORJSON_DISPONIBLE else 0
+
+
+def dumps(data: Any) -> bytes:
+    """JSON compacto en UTF-8 (orjson si está instalado; mismo formato con json)"""
+    if ORJSON_DISPONIBLE:
+        return orjson.dumps(data, default=str, option=_ORJSON_OPTIONS)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str).encode()
+
+
+def splice(data: Dict[str, Any], **raw: bytes) -> bytes:
+    """Objeto JSON con data serializado y cada campo de raw insertado tal cual (ya es JSON)
+
+    Permite devolver el cuerpo de PostgREST sin decodificarlo y volver a codificarlo:
+    splice({"tenant": "x"}, cursos=b'[...]') -> b'{"tenant":"x","cursos":[...]}'
+    """
+    head = dumps(data)[:-1]
+    fields = b",".join(dumps(name) + b":" + value.strip() for name, value in raw.items())
+    separator = b"," if len(head) > 1 and fields else b""
+    return head + separator + fields + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializado con orjson (respuesta por defecto de la app)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,64 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Compartir lecturas idénticas en curso hacia Supabase (ver SupabaseClient.get)
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+class SingleFlight:
+    """Llamadas concurrentes con la misma clave comparten una sola ejecución
+
+    La primera (líder) lanza la llamada como tarea; las que llegan mientras sigue en
+    curso esperan ese mismo resultado (o excepción). Cancelar a quien espera no cancela
+    la llamada compartida. Las claves son tuplas cuyo primer elemento es la etiqueta
+    (tabla) con la que se agrupan las métricas.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # etiqueta -> [líderes, compartidas]
+        self._counts: Dict[str, list] = defaultdict(lambda: [0, 0])
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        counts = self._counts[key[0]]
+        task = self._inflight.get(key)
+        if task is None:
+            counts[0] += 1
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            counts[1] += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # La excepción ya la reciben quienes esperaban; evitar el aviso si no quedó nadie
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, label: str) -> int:
+        """Que las próximas llamadas de la etiqueta no se unan a las que ya están en curso
+        (p. ej. tras escribir en la tabla, para no devolver una lectura anterior)"""
+        keys = [k for k in self._inflight if k[0] == label]
+        for k in keys:
+            del self._inflight[k]
+        return len(keys)
+
+    def by_label(self) -> Dict[str, Tuple[int, int]]:
+        """etiqueta -> (llamadas ejecutadas, llamadas que se unieron a una en curso)"""
+        return {label: (leaders, shared) for label, (leaders, shared) in self._counts.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        leaders = sum(c[0] for c in self._counts.values())
+        shared = sum(c[1] for c in self._counts.values())
+        return {
+            "enabled": SINGLEFLIGHT_ENABLED,
+            "in_flight": len(self._inflight),
+            "executed": leaders,
+            "shared": shared,
+            # Requests de la app por cada llamada real a Supabase
+            "fan_in": round((leaders + shared) / leaders, 4) if leaders else 0.0,
+        }
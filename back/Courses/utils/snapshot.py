@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.export import iter_pages
+from utils.pagination import encode_cursor, quote
+from utils.response_cache import invalidate_tenant_responses
+from utils.supabase import get_supabase_client, warm_tenant_cache
+
+# Copia local de {schema}_cursos (y tenants) para servir lecturas sin ir a Supabase
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "false").lower() in ("1", "true", "yes")
+# Cada cuánto se piden los cambios (updated_at/created_at) de cada tenant
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "5"))
+# Recarga completa (detecta filas borradas) y de la tabla de tenants
+SNAPSHOT_FULL_RELOAD = float(os.getenv("SNAPSHOT_FULL_RELOAD", "300"))
+# Si la última actualización exitosa es más vieja, se vuelve a leer de Supabase
+SNAPSHOT_MAX_STALENESS = float(os.getenv("SNAPSHOT_MAX_STALENESS", "30"))
+
+
+def _changed_at(row: Dict) -> str:
+    return max(row.get("updated_at") or "", row.get("created_at") or "")
+
+
+class CourseSnapshot:
+    """Cursos de un tenant en memoria, indexados por id, por código y en orden (nombre, id)
+
+    El orden compara cadenas en Python; puede diferir de la collation de Postgres en
+    mayúsculas/acentos, pero es estable, así que los cursores siguen siendo válidos.
+    """
+
+    def __init__(self, schema: str):
+        self.schema = schema
+        self.by_id: Dict[Any, Dict] = {}
+        self._order: List[Tuple[str, Any]] = []
+        self._codigos: List[Tuple[str, Any]] = []
+        self.watermark = ""
+        self.refreshed_at = 0.0
+        self.reloaded_at = 0.0
+
+    @property
+    def fresh(self) -> bool:
+        return bool(self.refreshed_at) and time.monotonic() - self.refreshed_at <= SNAPSHOT_MAX_STALENESS
+
+    def age(self) -> float:
+        return time.monotonic() - self.refreshed_at if self.refreshed_at else float("inf")
+
+    def replace(self, rows: Iterable[Dict]):
+        """Reemplazar el contenido completo (recarga)"""
+        self.by_id = {row["id"]: row for row in rows}
+        self._order = sorted((row.get("nombre") or "", row["id"]) for row in self.by_id.values())
+        self._codigos = sorted((row.get("codigo") or "", row["id"]) for row in self.by_id.values())
+        self.watermark = max((_changed_at(row) for row in self.by_id.values()), default="")
+
+    def upsert(self, rows: Iterable[Dict], advance: bool = True) -> int:
+        """Aplicar filas nuevas o modificadas; devuelve cuántas cambiaron
+
+        advance=False no mueve la marca de agua (filas con timestamps generados por la app,
+        cuyo reloj puede ir adelantado respecto al de la base).
+        """
+        changed = 0
+        for row in rows:
+            old = self.by_id.get(row["id"])
+            if old == row:
+                continue
+            if old is not None:
+                self._remove(self._order, (old.get("nombre") or "", old["id"]))
+                self._remove(self._codigos, (old.get("codigo") or "", old["id"]))
+            self.by_id[row["id"]] = row
+            bisect.insort(self._order, (row.get("nombre") or "", row["id"]))
+            bisect.insort(self._codigos, (row.get("codigo") or "", row["id"]))
+            if advance:
+                self.watermark = max(self.watermark, _changed_at(row))
+            changed += 1
+        return changed
+
+    @staticmethod
+    def _remove(index: List[Tuple[str, Any]], key: Tuple[str, Any]):
+        i = bisect.bisect_left(index, key)
+        if i < len(index) and index[i] == key:
+            index.pop(i)
+
+    def query(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, Any]] = None,
+        columns: Optional[List[str]] = None,
+        codigo: Optional[str] = None,
+        nombre: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Misma semántica que el select de _query_courses: (cursos, next_cursor)"""
+        allowed = None
+        if codigo:
+            # Prefijo exacto (like 'X%'): rango contiguo en el índice por código
+            start = bisect.bisect_left(self._codigos, (codigo,))
+            allowed = set()
+            for key, curso_id in self._codigos[start:]:
+                if not key.startswith(codigo):
+                    break
+                allowed.add(curso_id)
+        prefix = nombre.casefold() if nombre else None
+        start = bisect.bisect_right(self._order, tuple(after)) if after else 0
+
+        cursos: List[Dict] = []
+        next_cursor = None
+        for key, curso_id in self._order[start:]:
+            if allowed is not None and curso_id not in allowed:
+                continue
+            if prefix is not None and not key.casefold().startswith(prefix):
+                continue
+            if limit and len(cursos) == limit:
+                last = cursos[-1]
+                next_cursor = encode_cursor(last["nombre"], last["id"])
+                break
+            row = self.by_id[curso_id]
+            cursos.append({c: row.get(c) for c in columns} if columns else row)
+        return cursos, next_cursor
+
+
+class SnapshotStore:
+    """Snapshots por tenant con actualización periódica en segundo plano"""
+
+    def __init__(self):
+        self.snapshots: Dict[str, CourseSnapshot] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Invalidaciones lanzadas desde apply (síncrono)
+        self._invalidations: Set[asyncio.Task] = set()
+        self.refreshes = 0
+        self.reloads = 0
+        self.errors = 0
+        self.rows_applied = 0
+
+    def get(self, schema: str) -> Optional[CourseSnapshot]:
+        """Snapshot utilizable del tenant; si no existe o está vencido se empieza a (re)cargar
+        y se devuelve None (sin depender de que el polling siga vivo)"""
+        if not SNAPSHOT_MODE:
+            return None
+        snapshot = self.snapshots.get(schema)
+        if snapshot is None or not snapshot.fresh:
+            self._load_later(schema)
+            return None
+        return snapshot
+
+    def _load_later(self, schema: str):
+        if schema in self._loading:
+            return
+        task = asyncio.ensure_future(self._safe(self.reload(schema)))
+        self._loading[schema] = task
+        task.add_done_callback(lambda _: self._loading.pop(schema, None))
+
+    async def _safe(self, work) -> bool:
+        try:
+            await work
+            return True
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Snapshot: {e}")
+            return False
+
+    # ─── Carga y actualización ───────────────────────────────
+
+    async def start(self) -> int:
+        """Cargar tenants y cursos de todos los tenants; arranca la actualización periódica"""
+        if not SNAPSHOT_MODE:
+            return 0
+        # El polling arranca aunque la carga inicial falle: los tenants se cargan al primer uso
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        tenants = await warm_tenant_cache()
+        await asyncio.gather(*[self.reload(t["schema_name"]) for t in tenants if t.get("schema_name")])
+        return sum(len(s.by_id) for s in self.snapshots.values())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self, schema: str) -> CourseSnapshot:
+        """Leer la tabla completa del tenant"""
+        rows: List[Dict] = []
+        async for page in iter_pages(get_supabase_client(), f"{schema}_cursos", {"select": "*"}):
+            rows.extend(page)
+        snapshot = self.snapshots.get(schema) or CourseSnapshot(schema)
+        before = snapshot.by_id
+        snapshot.replace(rows)
+        snapshot.refreshed_at = snapshot.reloaded_at = time.monotonic()
+        self.snapshots[schema] = snapshot
+        self.reloads += 1
+        if before and before != snapshot.by_id:
+            await self._invalidate(schema)
+        return snapshot
+
+    async def refresh(self, schema: str) -> int:
+        """Traer solo las filas creadas o modificadas desde la última marca"""
+        snapshot = self.snapshots.get(schema)
+        if snapshot is None:
+            await self.reload(schema)
+            return 0
+        params = {"select": "*"}
+        if snapshot.watermark:
+            # gte: las filas con la misma marca se vuelven a aplicar (upsert idempotente)
+            mark = quote(snapshot.watermark)
+            params["or"] = f"(updated_at.gte.{mark},created_at.gte.{mark})"
+        changed = 0
+        async for page in iter_pages(get_supabase_client(), f"{schema}_cursos", params):
+            changed += snapshot.upsert(page)
+        snapshot.refreshed_at = time.monotonic()
+        self.refreshes += 1
+        if changed:
+            self.rows_applied += changed
+            await self._invalidate(schema)
+        return changed
+
+    def apply(self, schema: str, rows: List[Dict]):
+        """Aplicar filas escritas por este proceso (lectura de lo propio sin esperar el polling)"""
+        snapshot = self.snapshots.get(schema)
+        if snapshot is not None and snapshot.upsert(rows, advance=False):
+            task = asyncio.ensure_future(self._safe(self._invalidate(schema)))
+            self._invalidations.add(task)
+            task.add_done_callback(self._invalidations.discard)
+
+    @staticmethod
+    async def _invalidate(schema: str):
+        # Evict + publicación: con CACHE_BACKEND=redis también se borra la copia compartida
+        # y se avisa a los demás workers
+        await invalidate_tenant_responses(schema)
+
+    async def _loop(self):
+        last_full = time.monotonic()
+        while True:
+            await asyncio.sleep(SNAPSHOT_REFRESH_INTERVAL)
+            full = time.monotonic() - last_full >= SNAPSHOT_FULL_RELOAD
+            if full:
+                last_full = time.monotonic()
+                await self._safe(warm_tenant_cache())
+            schemas = list(self.snapshots)
+            await asyncio.gather(*[
+                self._safe(self.reload(schema) if full else self.refresh(schema)) for schema in schemas
+            ])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": SNAPSHOT_MODE,
+            "running": self._task is not None,
+            "refreshes": self.refreshes,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "rows_applied": self.rows_applied,
+            "tenants": {
+                schema: {"rows": len(s.by_id), "age": round(s.age(), 3), "fresh": s.fresh, "watermark": s.watermark}
+                for schema, s in self.snapshots.items()
+            },
+        }
+
+
+snapshot_store = SnapshotStore()
@@ -1,14 +1,100 @@
-import httpx
+import asyncio
+import functools
+import hashlib
+import hmac
 import os
-from typing import Optional, Dict
-from fastapi import HTTPException, Header
+import time
+from typing import Dict, List, Optional
+from fastapi import HTTPException, Header, Request
+import httpx
 import jwt
 
+from utils.cache import TTLCache
+from utils.resilience import STALE_IF_ERROR_TTL, UpstreamError
+from utils.supabase_client import SupabaseClient
+
 # Variables de entorno
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", SUPABASE_ANON_KEY)
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", SUPABASE_SERVICE_ROLE_KEY)
+
+# Claves asimétricas (RS256/ES256) publicadas por Supabase Auth; opcional
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL")
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", "600"))
+JWKS_ALGORITHMS = ("RS256", "ES256")
+
+@functools.lru_cache(maxsize=1)
+def _jwks_client() -> Optional[jwt.PyJWKClient]:
+    """Cliente JWKS, creado con el primer token asimétrico (no en cada arranque)"""
+    if not SUPABASE_JWKS_URL:
+        return None
+    return jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=JWKS_CACHE_TTL)
+
+# Caché de tokens ya verificados (por hash del token), cada entrada vence en su exp
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "3600"))
+JWT_CACHE_MAXSIZE = int(os.getenv("JWT_CACHE_MAXSIZE", "10000"))
+
+jwt_cache = TTLCache("jwt", ttl=JWT_CACHE_TTL, maxsize=JWT_CACHE_MAXSIZE)
+
+# Caché de tenants: la tabla casi nunca cambia
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "600"))
+TENANT_CACHE_NEGATIVE_TTL = float(os.getenv("TENANT_CACHE_NEGATIVE_TTL", "60"))
+TENANT_CACHE_MAXSIZE = int(os.getenv("TENANT_CACHE_MAXSIZE", "256"))
+
+tenant_cache = TTLCache(
+    "tenants",
+    ttl=TENANT_CACHE_TTL,
+    maxsize=TENANT_CACHE_MAXSIZE,
+    negative_ttl=TENANT_CACHE_NEGATIVE_TTL,
+    shared=True,
+    fallback_ttl=STALE_IF_ERROR_TTL,
+    fallback_on=(UpstreamError,)
+)
+
+# Caché de usuarios/roles por (schema, email); el servicio Roles lo invalida al cambiar un rol
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_STALE_TTL = float(os.getenv("USER_CACHE_STALE_TTL", "300"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "15"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "5000"))
+
+user_cache = TTLCache(
+    "users",
+    ttl=USER_CACHE_TTL,
+    maxsize=USER_CACHE_MAXSIZE,
+    negative_ttl=USER_CACHE_NEGATIVE_TTL,
+    stale_ttl=USER_CACHE_STALE_TTL,
+    shared=True,
+    fallback_ttl=STALE_IF_ERROR_TTL,
+    fallback_on=(UpstreamError,)
+)
+
+# Cliente compartido, creado en el lifespan de la app (main.py)
+_supabase_client: Optional[SupabaseClient] = None
+
+async def init_supabase_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> SupabaseClient:
+    """Crear el cliente compartido de Supabase"""
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = SupabaseClient(
+            SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY, transport=transport
+        )
+    return await _supabase_client.start()
+
+async def close_supabase_client():
+    """Cerrar el cliente compartido de Supabase"""
+    global _supabase_client
+    if _supabase_client is not None:
+        await _supabase_client.close()
+        _supabase_client = None
+
+def get_supabase_client() -> SupabaseClient:
+    """Cliente compartido (se crea de forma perezosa fuera del lifespan)"""
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = SupabaseClient(SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY)
+    return _supabase_client
 
 def get_tenant_from_email(email: str) -> Optional[str]:
     """Obtener dominio del tenant según el email"""
@@ -23,65 +109,128 @@ def get_tenant_from_email(email: str) -> Optional[str]:
         return "gmail.com"
     return None
 
+async def _fetch_tenant_info(domain: str) -> Optional[Dict]:
+    """Consultar el tenant en Supabase (sin caché)"""
+    response = await get_supabase_client().get(
+        "tenants",
+        params={"domain": f"eq.{domain}", "select": "*"}
+    )
+    if response.status_code != 200:
+        raise UpstreamError(f"Supabase respondió {response.status_code} al buscar tenant")
+    tenants = response.json()
+    return tenants[0] if tenants else None
+
 async def get_tenant_info(domain: str) -> Optional[Dict]:
-    """Obtener información del tenant desde Supabase"""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_ANON_KEY,
-                "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-            }
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/tenants?domain=eq.{domain}&select=*",
-                headers=headers
-            )
-            if response.status_code == 200:
-                tenants = response.json()
-                return tenants[0] if tenants else None
-    except Exception as e:
-        print(f"❌ Error obteniendo tenant info: {e}")
-    return None
+    """Obtener información del tenant (con caché TTL y carga única)
+
+    None solo si el tenant no existe; si Supabase falla y no hay valor en caché
+    se propaga UpstreamError (503), en lugar de confundirlo con un 404.
+    """
+    return await tenant_cache.get_or_load(domain, lambda: _fetch_tenant_info(domain))
 
-async def get_current_user(authorization: str = Header(None)) -> Dict:
-    """Extraer y validar usuario del token JWT"""
+async def warm_tenant_cache() -> List[Dict]:
+    """Cargar todos los tenants en caché con un solo request (antes de recibir tráfico)"""
+    response = await get_supabase_client().get("tenants", params={"select": "*"})
+    if response.status_code != 200:
+        raise RuntimeError(f"Supabase respondió {response.status_code} al listar tenants")
+    tenants = response.json()
+    for tenant in tenants:
+        tenant_cache.set(tenant["domain"], tenant)
+    return tenants
+
+async def invalidate_tenant_cache(domain: Optional[str] = None) -> int:
+    """Invalidar un tenant o todo el caché de tenants (en todos los workers)"""
+    if domain:
+        return await tenant_cache.evict(domain)
+    return await tenant_cache.evict()
+
+def _decode_token(token: str) -> Dict:
+    """Verificar firma, expiración y audiencia del JWT (HS256 o claves JWKS)"""
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg", "HS256")
+    if alg == "HS256":
+        key = SUPABASE_JWT_SECRET
+    elif alg in JWKS_ALGORITHMS and SUPABASE_JWKS_URL:
+        key = _jwks_client().get_signing_key_from_jwt(token).key
+    else:
+        raise jwt.InvalidAlgorithmError(f"Algoritmo no soportado: {alg}")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[alg],
+        audience="authenticated",
+        options={"verify_aud": True}
+    )
+
+async def get_current_user(request: Request, authorization: str = Header(None)) -> Dict:
+    """Dependencia de autenticación: valida el JWT (con caché) y lo deja en request.state.user"""
+    cached_user = getattr(request.state, "user", None)
+    if cached_user is not None:
+        return cached_user
+    
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token no proporcionado")
     
     token = authorization.split(" ")[1]
-    try:
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience="authenticated",
-            options={"verify_aud": True}
-        )
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    found, user = jwt_cache.get(token_key)
+    if not found:
+        jwt_cache.misses += 1
+        try:
+            if SUPABASE_JWKS_URL and jwt.get_unverified_header(token).get("alg") in JWKS_ALGORITHMS:
+                # PyJWKClient descarga las claves de forma síncrona; no bloquear el event loop
+                payload = await asyncio.to_thread(_decode_token, token)
+            else:
+                payload = _decode_token(token)
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expirado")
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError) as e:
+            print(f"❌ Token inválido: {e}")
+            raise HTTPException(status_code=401, detail="Token inválido")
+        
         email = payload.get("email")
         if not email:
             raise HTTPException(status_code=401, detail="Email no encontrado en token")
-        return {"email": email, "user_id": payload.get("sub")}
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.InvalidTokenError as e:
-        print(f"❌ Token inválido: {e}")
-        raise HTTPException(status_code=401, detail="Token inválido")
+        user = {
+            "email": email,
+            "user_id": payload.get("sub"),
+            "tenant_domain": get_tenant_from_email(email)
+        }
+        # El token deja de ser válido en exp: la entrada vence ahí (o antes, según JWT_CACHE_TTL)
+        exp = payload.get("exp")
+        ttl = min(JWT_CACHE_TTL, exp - time.time()) if exp else JWT_CACHE_TTL
+        jwt_cache.set(token_key, user, ttl=ttl)
+    else:
+        jwt_cache.hits += 1
+    
+    request.state.user = user
+    return user
+
+async def verify_admin_key(x_admin_key: str = Header(None)):
+    """Validar la clave de servicio para endpoints administrativos"""
+    if not x_admin_key or not ADMIN_API_KEY or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Clave de administración inválida")
+
+async def _fetch_user_by_email(email: str, schema: str) -> Optional[Dict]:
+    """Consultar el usuario en Supabase (sin caché)"""
+    table_name = f"{schema}_usuarios"
+    response = await get_supabase_client().get(
+        table_name,
+        params={"email": f"eq.{email}", "select": "*"},
+        service_role=True
+    )
+    if response.status_code != 200:
+        raise UpstreamError(f"Supabase respondió {response.status_code} al buscar usuario")
+    users = response.json()
+    return users[0] if users else None
 
 async def get_user_by_email(email: str, schema: str) -> Optional[Dict]:
-    """Obtener datos del usuario por email"""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}"
-            }
-            table_name = f"{schema}_usuarios"
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/{table_name}?email=eq.{email}&select=*",
-                headers=headers
-            )
-            if response.status_code == 200:
-                users = response.json()
-                return users[0] if users else None
-    except Exception as e:
-        print(f"❌ Error obteniendo usuario: {e}")
-    return None
+    """Obtener datos del usuario por email (con caché por schema/email)
+
+    Igual que get_tenant_info: un fallo de Supabase es UpstreamError, no un usuario inexistente.
+    """
+    return await user_cache.get_or_load((schema, email), lambda: _fetch_user_by_email(email, schema))
+
+async def invalidate_user_cache(schema: Optional[str] = None, email: Optional[str] = None) -> int:
+    """Invalidar usuarios en caché filtrando por schema y/o email (en todos los workers)"""
+    return await user_cache.evict_matching((schema, email or None))
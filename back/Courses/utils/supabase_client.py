@@ -0,0 +1,280 @@
+import asyncio
+import importlib.util
+import httpx
+import os
+import time
+from typing import Callable, Optional, Dict, Any, List, Union
+
+from utils.resilience import (
+    RETRY_METHODS, RETRY_STATUSES, SUPABASE_HEDGE_DELAY, SUPABASE_RETRIES,
+    Bulkhead, CircuitBreaker, UpstreamError, backoff, is_failure
+)
+from utils.singleflight import SINGLEFLIGHT_ENABLED, SingleFlight
+
+# Configuración del pool de conexiones hacia Supabase
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Timeouts por defecto (segundos); cada llamada puede sobreescribirlos
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "5"))
+
+# httpx importa h2 recién al abrir una conexión HTTP/2; aquí basta saber si está instalado
+HTTP2_DISPONIBLE = importlib.util.find_spec("h2") is not None
+
+TimeoutType = Union[float, httpx.Timeout, None]
+
+# Observadores de cada llamada: (método, tabla, status o None si falló, segundos)
+UpstreamHook = Callable[[str, str, Optional[int], float], None]
+_upstream_hooks: List[UpstreamHook] = []
+
+
+def add_upstream_hook(hook: UpstreamHook):
+    """Registrar un observador de todas las llamadas a Supabase (métricas, trazas)"""
+    if hook not in _upstream_hooks:
+        _upstream_hooks.append(hook)
+
+
+def _tenant_of(table: str) -> str:
+    """tenant_ucb_cursos -> tenant_ucb; tablas globales (tenants) comparten un mismo cupo"""
+    return table.rsplit("_", 1)[0] if "_" in table else "global"
+
+
+class SupabaseClient:
+    """Cliente compartido (keep-alive + HTTP/2) para la API REST de Supabase"""
+
+    def __init__(
+        self,
+        url: str,
+        anon_key: str,
+        service_role_key: str,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = (url or "").rstrip("/")
+        self.anon_key = anon_key
+        self.service_role_key = service_role_key
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = SUPABASE_HTTP2 and HTTP2_DISPONIBLE and transport is None
+
+        # Métricas de uso del pool
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.retries_total = 0
+        self.hedged_total = 0
+
+        # Resiliencia: un circuito por tabla y un límite de concurrencia por tenant
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.bulkhead = Bulkhead()
+        self.hedge_delay = SUPABASE_HEDGE_DELAY
+        # GETs idénticos en curso comparten una sola llamada
+        self.singleflight = SingleFlight()
+        # Se activa cuando no queda ninguna llamada en curso (para el apagado ordenado)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def start(self) -> "SupabaseClient":
+        """Crear el cliente HTTP (se llama en el lifespan de la app)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.url}/rest/v1",
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                    keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    SUPABASE_TIMEOUT,
+                    connect=SUPABASE_CONNECT_TIMEOUT,
+                    pool=SUPABASE_POOL_TIMEOUT,
+                ),
+                transport=self._transport,
+            )
+        return self
+
+    async def close(self):
+        """Cerrar las conexiones del pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Cliente de Supabase no inicializado")
+        return self._client
+
+    def headers(self, service_role: bool = False, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Headers de autenticación (anon o service role)"""
+        key = self.service_role_key if service_role else self.anon_key
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        if extra:
+            headers.update(extra)
+        return headers
+
+    async def request(
+        self,
+        method: str,
+        table: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        service_role: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: TimeoutType = None,
+    ) -> httpx.Response:
+        """Ejecutar una petición contra /rest/v1/{table}"""
+        if self._client is None:
+            await self.start()
+
+        kwargs: Dict[str, Any] = {
+            "params": params,
+            "headers": self.headers(service_role, headers),
+        }
+        if json is not None:
+            kwargs["json"] = json
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        breaker = self.breakers.get(table)
+        if breaker is None:
+            breaker = self.breakers[table] = CircuitBreaker(table)
+        attempts = 1 + SUPABASE_RETRIES if method in RETRY_METHODS else 1
+        hedge = self.hedge_delay > 0 and method in RETRY_METHODS
+
+        async with self.bulkhead.slot(_tenant_of(table)):
+            for attempt in range(attempts):
+                if attempt:
+                    self.retries_total += 1
+                    await asyncio.sleep(backoff(attempt - 1))
+                breaker.before_call()
+                last = attempt == attempts - 1
+                try:
+                    if hedge:
+                        response = await self._hedged(method, table, kwargs)
+                    else:
+                        response = await self._send(method, table, kwargs)
+                except httpx.TransportError as e:
+                    breaker.record_failure()
+                    if last:
+                        raise UpstreamError(f"Supabase no disponible ({table}): {e!r}") from e
+                    continue
+                except BaseException:
+                    breaker.abort()
+                    raise
+                if is_failure(response.status_code):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if last or response.status_code not in RETRY_STATUSES:
+                    return response
+                await response.aclose()
+
+    async def _send(self, method: str, table: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        """Un intento contra Supabase, con métricas"""
+        self.requests_total += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self._idle.clear()
+        status = None
+        start = time.perf_counter()
+        try:
+            response = await self._client.request(method, f"/{table}", **kwargs)
+            status = response.status_code
+            return response
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+            elapsed = time.perf_counter() - start
+            for hook in _upstream_hooks:
+                hook(method, table, status, elapsed)
+
+    async def _hedged(self, method: str, table: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        """Si el primer intento tarda más que hedge_delay, lanzar un segundo y quedarse con el primero que responda"""
+        first = asyncio.ensure_future(self._send(method, table, kwargs))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+        self.hedged_total += 1
+        pending = {first, asyncio.ensure_future(self._send(method, table, kwargs))}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None or not pending:
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def drain(self, timeout: float) -> bool:
+        """Esperar a que terminen las llamadas en curso; False si se agotó el tiempo"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def breaker_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {table: b.stats() for table, b in self.breakers.items()}
+
+    async def get(self, table: str, *, coalesce: bool = True, **kwargs) -> httpx.Response:
+        """GET; si ya hay uno idéntico en curso (tabla, params, rol, headers) se comparte su respuesta"""
+        if not (coalesce and SINGLEFLIGHT_ENABLED):
+            return await self.request("GET", table, **kwargs)
+        key = (
+            table,
+            str(httpx.QueryParams(kwargs.get("params") or {})),
+            kwargs.get("service_role", False),
+            tuple(sorted((kwargs.get("headers") or {}).items())),
+        )
+        return await self.singleflight.do(key, lambda: self.request("GET", table, **kwargs))
+
+    async def post(self, table: str, **kwargs) -> httpx.Response:
+        try:
+            return await self.request("POST", table, **kwargs)
+        finally:
+            self.singleflight.forget(table)
+
+    async def delete(self, table: str, **kwargs) -> httpx.Response:
+        try:
+            return await self.request("DELETE", table, **kwargs)
+        finally:
+            self.singleflight.forget(table)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del pool de conexiones"""
+        connections = []
+        if self._client is not None:
+            pool = getattr(self._client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": SUPABASE_MAX_CONNECTIONS,
+            "max_keepalive_connections": SUPABASE_MAX_KEEPALIVE,
+            "connections": len(connections),
+            "connections_active": len(connections) - idle,
+            "connections_idle": idle,
+            "utilization": round((len(connections) - idle) / SUPABASE_MAX_CONNECTIONS, 4) if SUPABASE_MAX_CONNECTIONS else 0.0,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "retries_total": self.retries_total,
+            "hedged_total": self.hedged_total,
+            "circuits_open": sorted(t for t, b in self.breakers.items() if b.state != "closed"),
+            "bulkhead": self.bulkhead.stats(),
+            "singleflight": self.singleflight.stats(),
+        }
@@ -0,0 +1,408 @@
+import asyncio
+import glob
+import json
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from utils.cache import get_cache_backend
+from utils.resilience import UpstreamError, backoff
+from utils.serialization import dumps
+
+# Escrituras asíncronas (202 + id de trabajo): "sync" por defecto; con "async" siempre,
+# o por request con el header "Prefer: respond-async"
+WRITE_QUEUE_MODE = os.getenv("WRITE_QUEUE_MODE", "sync").lower()
+# Trabajos en cola antes de rechazar con 503 (backpressure)
+WRITE_QUEUE_MAXSIZE = int(os.getenv("WRITE_QUEUE_MAXSIZE", "10000"))
+# Filas por escritura hacia Supabase y espera para juntar un lote
+WRITE_QUEUE_BATCH = int(os.getenv("WRITE_QUEUE_BATCH", "200"))
+WRITE_QUEUE_LINGER = float(os.getenv("WRITE_QUEUE_LINGER", "0.05"))
+# Intentos ante fallos de Supabase antes de marcar el trabajo con error
+WRITE_QUEUE_MAX_ATTEMPTS = int(os.getenv("WRITE_QUEUE_MAX_ATTEMPTS", "5"))
+# Directorio del journal (vacío = solo en memoria; se pierde lo pendiente al reiniciar)
+WRITE_QUEUE_JOURNAL_DIR = os.getenv("WRITE_QUEUE_JOURNAL_DIR", "")
+WRITE_QUEUE_FSYNC = os.getenv("WRITE_QUEUE_FSYNC", "false").lower() in ("1", "true", "yes")
+# Identidad de la instancia en el nombre del journal (el hostname del contenedor por defecto);
+# los PIDs solo se comparan entre journals de la misma instancia
+WRITE_QUEUE_INSTANCE = (os.getenv("WRITE_QUEUE_INSTANCE") or socket.gethostname() or "local").replace(os.sep, "_")
+# Segundos que se conserva el estado de un trabajo terminado
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+
+FINAL_STATES = ("completado", "error")
+
+# (schema, payloads) -> un resultado por payload, con "estado" ("error" marca el trabajo con error)
+Handler = Callable[[str, List[Dict]], Awaitable[List[Dict]]]
+
+
+def wants_async(request: Request) -> bool:
+    """¿El cliente (o la configuración) pide respuesta asíncrona?"""
+    return WRITE_QUEUE_MODE == "async" or "respond-async" in request.headers.get("prefer", "").lower()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Journal:
+    """Registro append-only de trabajos (JSONL) para no perder los pendientes al reiniciar
+
+    Cada worker escribe su propio archivo (journal-<instancia>-<pid>.jsonl); al arrancar,
+    un worker reclama los archivos de procesos de su misma instancia que ya no existen y
+    vuelve a encolar lo pendiente. Los de otras instancias (otro contenedor, otro espacio
+    de PIDs) no se tocan aunque el directorio sea compartido.
+    """
+
+    COMPACT_EVERY = 1000
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"journal-{WRITE_QUEUE_INSTANCE}-{os.getpid()}.jsonl")
+        self._file = None
+        self._done_since_compact = 0
+
+    def open(self) -> List[Dict]:
+        """Abrir el journal propio y devolver los trabajos pendientes de journals huérfanos
+
+        Lo recuperado se vuelve a escribir en el journal propio antes de borrar el archivo
+        reclamado, para que siga siendo durable si este proceso también muere.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        pending: List[Dict] = []
+        replayed: List[str] = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "journal-*.jsonl"))):
+            owner = self._owner(path)
+            if owner is None:
+                continue
+            instance, pid = owner
+            # Sin instancia: formato anterior (journal-<pid>.jsonl), se asume de esta instancia
+            if instance not in (None, WRITE_QUEUE_INSTANCE):
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            claimed = f"{path}.{os.getpid()}.replay"
+            try:
+                # rename es atómico: solo un worker reclama cada archivo
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            pending.extend(self._read_pending(claimed))
+            replayed.append(claimed)
+        self._file = open(self.path, "a", encoding="utf-8")
+        for job in pending:
+            job["estado"] = "pendiente"
+            self.add(job)
+        for claimed in replayed:
+            os.remove(claimed)
+        return pending
+
+    @staticmethod
+    def _owner(path: str) -> Optional[Tuple[Optional[str], int]]:
+        """(instancia, pid) a partir del nombre del journal; None si no es un journal"""
+        name = os.path.basename(path)[len("journal-"):-len(".jsonl")]
+        instance, _, pid = name.rpartition("-")
+        try:
+            return instance or None, int(pid)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _read_pending(path: str) -> List[Dict]:
+        jobs: Dict[str, Dict] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    continue
+                if entry.get("op") == "add":
+                    jobs[entry["job"]["id"]] = entry["job"]
+                elif entry.get("op") == "done":
+                    jobs.pop(entry["id"], None)
+        return list(jobs.values())
+
+    def _write(self, entry: Dict):
+        self._file.write(dumps(entry).decode() + "\n")
+        self._file.flush()
+        if WRITE_QUEUE_FSYNC:
+            os.fsync(self._file.fileno())
+
+    def add(self, job: Dict):
+        if self._file is not None:
+            self._write({"op": "add", "job": job})
+
+    def done(self, job_id: str, pending: List[Dict]):
+        if self._file is None:
+            return
+        self._write({"op": "done", "id": job_id})
+        self._done_since_compact += 1
+        if self._done_since_compact >= self.COMPACT_EVERY:
+            self._compact(pending)
+
+    def _compact(self, pending: List[Dict]):
+        """Reescribir el journal solo con los trabajos pendientes"""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for job in pending:
+                f.write(dumps({"op": "add", "job": job}).decode() + "\n")
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._done_since_compact = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WriteQueue:
+    """Cola en proceso de escrituras hacia Supabase, agrupadas en lotes por (operación, schema)"""
+
+    def __init__(
+        self,
+        maxsize: int = WRITE_QUEUE_MAXSIZE,
+        batch_size: int = WRITE_QUEUE_BATCH,
+        linger: float = WRITE_QUEUE_LINGER,
+        journal_dir: str = WRITE_QUEUE_JOURNAL_DIR,
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.linger = linger
+        self._handlers: Dict[str, Handler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Reintentos programados (backoff) -> trabajos que reencolan
+        self._retrying: Dict[asyncio.TimerHandle, List[Dict]] = {}
+        self._journal = _Journal(journal_dir) if journal_dir else None
+        self.accepting = True
+        # id -> trabajo (incluye terminados hasta JOB_TTL)
+        self.jobs: Dict[str, Dict] = {}
+
+        self.submitted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.retried = 0
+        self.finished: Dict[str, int] = defaultdict(int)
+
+    def register(self, op: str, handler: Handler):
+        self._handlers[op] = handler
+
+    # ─── Ciclo de vida ───────────────────────────────────────
+
+    async def start(self) -> "WriteQueue":
+        """Arrancar el worker y reencolar lo pendiente del journal"""
+        self.accepting = True
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+            if self._journal is not None:
+                pending = self._journal.open()
+                for job in pending:
+                    self._enqueue(job)
+                if pending:
+                    print(f"📥 Cola de escrituras: {len(pending)} trabajos recuperados del journal")
+        return self
+
+    async def stop(self, timeout: float) -> bool:
+        """Dejar de aceptar trabajos y esperar a que se vacíe la cola; False si quedaron pendientes"""
+        self.accepting = False
+        if self._worker is None:
+            return True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            drained = True
+        except asyncio.TimeoutError:
+            drained = False
+        if self._retrying:
+            # Los que esperaban un reintento quedan en el journal para el próximo arranque
+            drained = False
+            for handle in self._retrying:
+                handle.cancel()
+            self._retrying.clear()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._journal is not None:
+            # Lo que no se escribió queda en el journal para el próximo arranque
+            self._journal.close()
+        return drained
+
+    # ─── Encolar y consultar ─────────────────────────────────
+
+    async def submit(self, op: str, schema: str, payload: Dict) -> Dict:
+        """Encolar una escritura; 503 si la cola está llena o apagándose"""
+        if op not in self._handlers:
+            raise ValueError(f"Operación no registrada: {op}")
+        if self._worker is None:
+            await self.start()
+        if not self.accepting or self._queue.qsize() >= self.maxsize:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Cola de escrituras llena, intenta nuevamente",
+                headers={"Retry-After": "1"}
+            )
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "op": op,
+            "schema": schema,
+            "payload": payload,
+            "estado": "pendiente",
+            "resultado": None,
+            "error": None,
+            "intentos": 0,
+            "creado": now,
+            "actualizado": now,
+        }
+        if self._journal is not None:
+            self._journal.add(job)
+        self._enqueue(job)
+        self.submitted += 1
+        await self._publish(job)
+        return job
+
+    def _enqueue(self, job: Dict):
+        self.jobs[job["id"]] = job
+        self._queue.put_nowait(job)
+
+    async def status(self, job_id: str) -> Optional[Dict]:
+        """Estado del trabajo (de este worker o, con caché compartido, de cualquiera)"""
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        backend = get_cache_backend()
+        if backend.shared:
+            found = await backend.get("jobs", job_id)
+            if found is not None:
+                return json.loads(found[0])
+        return None
+
+    async def _publish(self, job: Dict):
+        """Con caché compartido (Redis) el estado es visible desde cualquier worker"""
+        backend = get_cache_backend()
+        if backend.shared:
+            await backend.set("jobs", job["id"], dumps(job), JOB_TTL)
+
+    def _prune(self):
+        limit = time.time() - JOB_TTL
+        expired = [i for i, j in self.jobs.items() if j["estado"] in FINAL_STATES and j["actualizado"] < limit]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    # ─── Worker ──────────────────────────────────────────────
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._process(batch)
+            except Exception as e:
+                print(f"❌ Error en la cola de escrituras: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch: List[Dict]):
+        groups: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+        for job in batch:
+            job["estado"] = "procesando"
+            groups[(job["op"], job["schema"])].append(job)
+        self.batches += 1
+        await asyncio.gather(*[self._write_group(op, schema, jobs) for (op, schema), jobs in groups.items()])
+
+    async def _write_group(self, op: str, schema: str, jobs: List[Dict]):
+        for job in jobs:
+            job["intentos"] += 1
+        try:
+            results = await self._handlers[op](schema, [job["payload"] for job in jobs])
+        except UpstreamError as e:
+            await self._retry_or_fail(jobs, str(e))
+            return
+        except Exception as e:
+            for job in jobs:
+                await self._finish(job, "error", error=str(e))
+            return
+        self.rows_written += len(jobs)
+        for job, result in zip(jobs, results):
+            estado = "error" if result.get("estado") == "error" else "completado"
+            await self._finish(job, estado, resultado=result, error=result.get("error"))
+
+    async def _retry_or_fail(self, jobs: List[Dict], error: str):
+        """Supabase no disponible: reencolar tras un backoff o rendirse tras WRITE_QUEUE_MAX_ATTEMPTS"""
+        retry = [job for job in jobs if job["intentos"] < WRITE_QUEUE_MAX_ATTEMPTS]
+        for job in jobs:
+            if job not in retry:
+                await self._finish(job, "error", error=error)
+        if not retry:
+            return
+        self.retried += len(retry)
+        for job in retry:
+            job["estado"] = "pendiente"
+            job["error"] = error
+        # Sin dormir en el worker: los lotes de otros tenants siguen mientras corre el backoff
+        delay = backoff(max(job["intentos"] for job in retry))
+        handle = asyncio.get_running_loop().call_later(delay, lambda: self._requeue(handle))
+        self._retrying[handle] = retry
+
+    def _requeue(self, handle: asyncio.TimerHandle):
+        for job in self._retrying.pop(handle, []):
+            self._queue.put_nowait(job)
+
+    async def _finish(self, job: Dict, estado: str, resultado: Optional[Dict] = None, error: Optional[str] = None):
+        job.update({"estado": estado, "resultado": resultado, "error": error, "actualizado": time.time()})
+        self.finished[estado] += 1
+        if self._journal is not None:
+            self._journal.done(job["id"], [j for j in self.jobs.values() if j["estado"] not in FINAL_STATES])
+        await self._publish(job)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": WRITE_QUEUE_MODE,
+            "running": self._worker is not None,
+            "accepting": self.accepting,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "retried": self.retried,
+            "retrying": sum(len(jobs) for jobs in self._retrying.values()),
+            "finished": dict(self.finished),
+            "journal": self._journal.path if self._journal is not None else None,
+        }
+
+
+# Cola única del proceso; los controladores registran sus operaciones al importarse
+write_queue = WriteQueue()